@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+    CppClient:
+    Thin client of the cppparser server: cppparser.py serve SOCKET
+
+    Copyright (C) 2015  Albert Zedlitz
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+# A build calls the client once per file: Only the modules needed for one request
+import sys
+import os
+import json
+import socket
+
+gUsage = '''usage: %s [--package PACKAGE] [--class CLASS] SOCKET [FILE [OUT]]
+
+Translate FILE or stdin on the server listening on SOCKET. The output is written
+to OUT or stdout. PACKAGE and CLASS are derived from FILE, if not given
+'''
+
+# ------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------
+def request(aAddress, aHeader, aBody=None):
+    """ Send one request and return the response header and output. The request is
+    a JSON header line followed by length bytes of UTF-8 source, see TServer """
+    xHeader = dict(aHeader)
+    xData   = b''
+    if aBody is not None:
+        xData = aBody.encode('utf-8', 'surrogateescape')
+        xHeader['length'] = len(xData)
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as xSocket:
+        xSocket.connect(aAddress)
+        xSocket.sendall(json.dumps(xHeader).encode('utf-8') + b'\n' + xData)
+        with xSocket.makefile('rb') as xFile:
+            xResult = json.loads(xFile.readline().decode('utf-8'))
+            xOutput = xFile.read(xResult['length']).decode('utf-8', 'surrogateescape')
+    return xResult, xOutput if 'out' not in aHeader else None
+
+# ------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------
+def main(argv=None):
+    """ Run one request. Returns 1, if the server returned no output """
+    program_name = os.path.basename(sys.argv[0])
+    if argv is None:
+        argv = sys.argv[1:]
+
+    xHeader = dict()
+    xArgs   = list()
+    xOption = { '--package': 'package', '--class': 'class' }
+    xIter   = iter(argv)
+    for xArg in xIter:
+        xName, xSep, xValue = xArg.partition('=')
+        if xArg in ('-h', '--help'):
+            sys.stdout.write(gUsage % program_name)
+            return 0
+        if xName in xOption:
+            xHeader[xOption[xName]] = xValue if xSep else next(xIter, None)
+            if xHeader[xOption[xName]] is None:
+                break
+        else:
+            xArgs.append(xArg)
+
+    if not 1 <= len(xArgs) <= 3 or None in xHeader.values():
+        sys.stderr.write(gUsage % program_name)
+        return 2
+
+    xBody = None
+    if len(xArgs) > 1:
+        xHeader['file'] = os.path.abspath(xArgs[1])
+    else:
+        xBody = sys.stdin.read()
+    if len(xArgs) > 2:
+        xHeader['out'] = os.path.abspath(xArgs[2])
+
+    try:
+        xResult, xOutput = request(xArgs[0], xHeader, xBody)
+    except (OSError, ValueError) as xEx:
+        sys.stderr.write('{}: {}, no output\n'.format(program_name, xEx))
+        return 1
+
+    if xOutput is not None:
+        sys.stdout.write(xOutput)
+    # Without source the build must not continue with an empty or stale file
+    if xResult.get('error') and not xResult.get('source'):
+        sys.stderr.write('{}: {}, no output\n'.format(program_name, xResult['error']))
+        return 1
+    if xResult.get('error'):
+        sys.stderr.write('{}: {}, passed unchanged\n'.format(program_name, xResult['error']))
+    return 0
+
+# ------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------
+if __name__ == "__main__":
+    sys.exit(main())
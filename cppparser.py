@@ -23,8 +23,28 @@
 import sys
 import os
 import re
+import time
+import io
+import json
+import shlex
 import shutil
+import signal
+import socket
+import socketserver
+import fnmatch
+import hashlib
+import sqlite3
+import difflib
+import tracemalloc
+import itertools
+import array
+import random
+import platform
+import mmap
+import locale
+from   enum     import IntEnum
 from   optparse import OptionParser
+from   concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 __all__     = []
 __version__ = 0.1
@@ -35,18 +55,71 @@ DEBUG   = 0
 TESTRUN = 0
 PROFILE = 0
 
+# ------------------------------------------------------------------------------------
+# Master scanner for translate: Each match is one typed token. Macros, comments and 
+# strings are read as block. OPEN marks a block, which is not terminated in the file.
+# Identifiers and punctuation carry the following characters without impact on the 
+# block structure (white space, operators), so these need no extra token. Identifiers
+# include digit separators 1'000 and stop before the prefix of R"(raw strings)"
+# ------------------------------------------------------------------------------------
+gTokenPattern = re.compile(r'''
+      (?P<IDENT>   ~?\w+(?:'\w+)*(?!["']) )  [^#/"'\w~{}=*:\[;(),]*
+    | (?P<PUNCT>   [{}=*:\[;(),] )     [^#/"'\w~{}=*:\[;(),]*
+    | (?P<TEXT>    [^#/"'\w~{}=*:\[;(),]+ | /(?![/*]) | ~ )
+    | (?P<MACRO>   \#[^\\\n]*(?:\\.[^\\\n]*)*(?:\n|\Z) )
+    | (?P<COMMENT> //[^\\\n]*(?:\\.[^\\\n]*)*(?:\n|\Z) | /\*[^*]*\*+(?:[^/*][^*]*\*+)*/ )
+    | (?P<STRING>  "[^"\\]*(?:\\.[^"\\]*)*" | '[^'\\]*(?:\\.[^'\\]*)*' )
+    | (?P<RAW>     (?:u8|[uUL])?R"(?P<DELIM>[^()\\\s"]{0,16})\(.*?\)(?P=DELIM)" )
+    | (?P<OPEN>    \# | /[/*] | ["'] )
+    ''', re.VERBOSE | re.DOTALL)
+
+# Argument list of an undefined macro, matched at the end of the macro name
+gUndefArgsPattern = re.compile(r'[ \t]*\([\w ,]*\)')
+
+# Preprocessor statements evaluated by translateDirective: the keyword selects the
+# handler, continuation lines and comments are removed from the arguments
+gDirectivePattern = re.compile(r'#\s*(\w*)(.*)', re.DOTALL)
+gDirectiveNoise   = re.compile(r'\\\n|/\*.*?\*/|//.*', re.DOTALL)
+gMacroNamePattern = re.compile(r'\s*(\w+)\s*(.*)', re.DOTALL)
+gIncludePattern   = re.compile(r'"([^"]+)"|<([^>]+)>')
+gGuardPattern     = re.compile(r'#\s*ifndef\s+(\w+)')
+
+# Name of an operator, matched at the end of the keyword operator 
+gOperatorPattern  = re.compile(r'''
+      \s*(?P<SYMBOL> \(\s*\) | \[\s*\] | ->\*? | <=> | <<=? | >>=? | && | \|\| | \+\+ | -- | [-+*/%^&|~!=<>,]=? )
+    | \s+(?P<WORD> \w+ )(?=\s*\() ''', re.VERBOSE)
+
+# Keywords, which introduce a class block
+gClassKeys        = frozenset(('class', 'struct', 'union'))
+
+# Keywords at the place of an argument name: The argument has no name
+gTypeKeys         = frozenset(('const', 'volatile', 'void', 'bool', 'char', 'short', 'int', 'long', 'float', 'double', 
+                               'signed', 'unsigned', 'auto', 'wchar_t'))
+
+# Keywords with an argument list outside of a function body, which is no function 
+# like the handler of a function try block X::X() try { } catch (...) { }
+gStatementKeys    = frozenset(('catch',))
+
+# Keywords before the type of an argument: const T is an argument without name
+gQualifierKeys    = frozenset(('const', 'volatile', 'typename', 'class', 'struct', 'union', 'enum'))
+
 # ------------------------------------------------------------------------------------
 # ------------------------------------------------------------------------------------
 class TranslateException (Exception):
-    def __init__(self):
-        super()
+    def __init__(self, aMessage=str()):
+        super().__init__(aMessage)
     
 # ------------------------------------------------------------------------------------
 # ------------------------------------------------------------------------------------
-class TBlock:
-    """ TBlock is the description of a block element, typically starting/ending with curly
-    brackets. There are some distinct type of block, which are handled individually 
-    """
+class TLimitException (TranslateException):
+    """ A translation exceeds one of TParser.mLimits or the source is not balanced,
+    the file is passed unchanged """
+    pass
+    
+# ------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------
+class TBlockType(IntEnum):
+    """ The distinct types of TBlock """
     STATEMENT   = 0
     CLASS       = 1
     METHOD      = 2
@@ -54,27 +127,47 @@ class TBlock:
     TEMPLATE    = 4
     DECLARATION = 5
     MACRO       = 6
-    gEnumNames  = ['STATEMENT', 'CLASS', 'METHOD', 'FUNC', 'TEMPL', 'DECL', 'MACRO']
+    INITIALIZER = 7
+    
+# ------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------
+class TBlock:
+    """ TBlock is the description of a block element, typically starting/ending with curly
+    brackets. There are some distinct type of block, which are handled individually. 
+    Argument lists are created on demand, plain statement blocks share one instance
+    per translation
+    """
+    STATEMENT   = TBlockType.STATEMENT
+    CLASS       = TBlockType.CLASS
+    METHOD      = TBlockType.METHOD
+    FUNCTION    = TBlockType.FUNCTION
+    TEMPLATE    = TBlockType.TEMPLATE
+    DECLARATION = TBlockType.DECLARATION
+    MACRO       = TBlockType.MACRO
+    INITIALIZER = TBlockType.INITIALIZER
+    
+    __slots__ = ( 'mListArgs', 'mBlockType', 'mBlockEnv', 'mNested', 'mClassName', 'mArguments', 
+                  'mName', 'mProcessing', 'mDone', 'mEnvProcess', 'mInject', 'mPackage' )
     
     # --------------------------------------------------------------------------------
     # --------------------------------------------------------------------------------            
     def __init__(self, aType, aDescr = "", aBlockEnv=None):
         """ Initializes a block.
         """
-        self.mListToken  = list()
-        self.mListArgs   = list()
+        self.mListArgs   = None
         self.mBlockType  = aType
         self.mBlockEnv   = aBlockEnv
         self.mNested     = None
         self.mClassName  = aDescr
         
         self.mArguments  = None
-        self.mMacroBlock = str()
         self.mName       = aDescr
         
         self.mProcessing = True
         self.mDone       = False
-        self.mSkipNested = False
+        self.mEnvProcess = True   # Processing state around a macro block
+        self.mInject     = None   # Output chunk, position, symbol and index entry of an injected function begin
+        self.mPackage    = None   # Package outside of a namespace block
         
         if not self.mBlockEnv:
             self.mBlockEnv = self
@@ -102,373 +195,1588 @@ class TBlock:
         
 # ------------------------------------------------------------------------------------
 # ------------------------------------------------------------------------------------
-class TParser:
-    """ Reads files from an input directory and injects sherlok statements """
+class TExpression:
+    """ TExpression evaluates the condition of #if and #elif with the C operators. 
+    Identifiers, which are not defined, evaluate to 0, defined identifiers to their 
+    value or 1. Values wrap to 64 bit intmax_t and shift counts are clamped as in a 
+    preprocessor, a negative count shifts in the other direction. Syntax errors 
+    raise TranslateException
+    
+    >>> TExpression({'A'}).evaluate('defined(A) && !defined B')
+    1
+    >>> TExpression({'V'}, {'V': 3}).evaluate('V >= 2 ? 0x10 % 3 : -1')
+    1
+    >>> TExpression(set()).evaluate('(1 << 4) / 3 == 5 && UNKNOWN == 0')
+    1
+    >>> [TExpression(set()).evaluate(x) for x in ('1 << 63 < 0', '1 << 10000000000', '4 << -1', '-1 >> 99')]
+    [1, 0, 2, -1]
+    """
+    gTokenPattern = re.compile(r'''\s*(?:
+          (?P<NUM>   (?:0[xX][0-9a-fA-F]+|\d+)[uUlL]* )
+        | (?P<CHAR>  '(?:\\.|[^\\'])*' )
+        | (?P<IDENT> [A-Za-z_]\w* )
+        | (?P<OP>    &&|\|\||<<|>>|<=|>=|==|!=|[-+*/%<>&^|!~?:()] ) )''', re.VERBOSE)
+    
+    gBits   = 64
+    gBinary = { '*': 10, '/': 10, '%': 10, '+': 9, '-': 9, '<<': 8, '>>': 8, 
+                '<': 7, '>': 7, '<=': 7, '>=': 7, '==': 6, '!=': 6, 
+                '&': 5, '^': 4, '|': 3, '&&': 2, '||': 1 }
+    
     # --------------------------------------------------------------------------------
     # --------------------------------------------------------------------------------            
-    def __init__(self, aInFile, aSherlokSrc):
-        """ aInFile could be a directory or single file 
-        aOutFile is a directory """
-        self.mInFile       = aInFile
-        self.mSherlokSrc   = aSherlokSrc
+    def __init__(self, aDefines, aValues=None):
+        """ aDefines is the set of defined names, aValues maps names to integers """
+        self.mDefines = aDefines
+        self.mValues  = aValues or dict()
+        self.mTokens  = list()
+        self.mPos     = 0
+        
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    @staticmethod
+    def toNumber(aText):
+        """ Return the value of an integer literal or None """
+        xText = aText.rstrip('uUlL')
+        try:
+            if xText[:1] == '0' and xText[1:2].isdigit():
+                return int(xText, 8)
+            return int(xText, 0)
+        except ValueError:
+            return None
+        
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    @classmethod
+    def wrap(cls, aValue):
+        """ Return aValue as signed integer of gBits """
+        xSign = 1 << (cls.gBits - 1)
+        return ((aValue + xSign) & ((xSign << 1) - 1)) - xSign
+        
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def evaluate(self, aText):
+        """ Return the integer value of the expression aText """
+        self.mTokens = list()
+        self.mPos    = 0
+        xPos         = 0
+        xText        = aText.rstrip()
+        while xPos < len(xText):
+            xToken = self.gTokenPattern.match(xText, xPos)
+            if not xToken:
+                raise TranslateException('invalid condition: {}'.format(aText.strip()))
+            self.mTokens.append((xToken.lastgroup, xToken.group(xToken.lastgroup)))
+            xPos = xToken.end()
+        self.mTokens.append((None, None))
+        
+        xValue = self.parseExpression(0)
+        if self.mPos != len(self.mTokens) - 1:
+            raise TranslateException('invalid condition: {}'.format(aText.strip()))
+        return xValue
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def expect(self, aOperator):
+        """ Read the operator aOperator """
+        if self.mTokens[self.mPos] != ('OP', aOperator):
+            raise TranslateException('missing {} in condition'.format(aOperator))
+        self.mPos += 1
+        
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def parseExpression(self, aMinPrec):
+        """ Read binary operators with a precedence of at least aMinPrec. The lowest 
+        precedence 0 includes the conditional operator """
+        xValue = self.parseUnary()
+        while True:
+            xKind, xOperator = self.mTokens[self.mPos]
+            if xKind != 'OP':
+                return xValue
+            
+            if xOperator == '?' and aMinPrec == 0:
+                self.mPos += 1
+                xTrue  = self.parseExpression(0)
+                self.expect(':')
+                xFalse = self.parseExpression(0)
+                xValue = xTrue if xValue else xFalse
+                continue
+            
+            xPrec = self.gBinary.get(xOperator)
+            if xPrec is None or xPrec < aMinPrec:
+                return xValue
+            self.mPos += 1
+            xValue = self.binary(xOperator, xValue, self.parseExpression(xPrec + 1))
+        
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def parseUnary(self):
+        """ Read a unary operator, a parenthesized expression or an operand """
+        xKind, xText = self.mTokens[self.mPos]
+        self.mPos += 1
+        
+        if xKind == 'NUM':
+            xValue = self.toNumber(xText)
+            if xValue is None:
+                raise TranslateException('invalid number {} in condition'.format(xText))
+            return self.wrap(xValue)
+        
+        if xKind == 'CHAR':
+            xChar = xText[1:-1].encode().decode('unicode_escape')
+            return ord(xChar[0]) if xChar else 0
+        
+        if xKind == 'IDENT':
+            if xText != 'defined':
+                return self.mValues.get(xText, 1) if xText in self.mDefines else 0
+            xParen = self.mTokens[self.mPos] == ('OP', '(')
+            if xParen:
+                self.mPos += 1
+            xKind, xName = self.mTokens[self.mPos]
+            if xKind != 'IDENT':
+                raise TranslateException('missing name after defined')
+            self.mPos += 1
+            if xParen:
+                self.expect(')')
+            return int(xName in self.mDefines)
+        
+        if xText == '(':
+            xValue = self.parseExpression(0)
+            self.expect(')')
+            return xValue
+        if xText == '!':
+            return int(not self.parseUnary())
+        if xText == '~':
+            return ~self.parseUnary()
+        if xText == '-':
+            return self.wrap(-self.parseUnary())
+        if xText == '+':
+            return self.parseUnary()
+        raise TranslateException('unexpected {} in condition'.format(xText))
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    @staticmethod
+    def binary(aOperator, aLeft, aRight):
+        """ Apply the binary operator. Division truncates toward zero as in C """
+        if aOperator in ('/', '%'):
+            if aRight == 0:
+                raise TranslateException('division by zero in condition')
+            xQuot = abs(aLeft) // abs(aRight)
+            if (aLeft < 0) != (aRight < 0):
+                xQuot = -xQuot
+            return TExpression.wrap(xQuot) if aOperator == '/' else aLeft - aRight * xQuot
+        if aOperator == '*':  return TExpression.wrap(aLeft * aRight)
+        if aOperator == '+':  return TExpression.wrap(aLeft + aRight)
+        if aOperator == '-':  return TExpression.wrap(aLeft - aRight)
+        if aOperator in ('<<', '>>'):
+            xBits  = TExpression.gBits
+            xShift = max(-xBits, min(xBits, aRight if aOperator == '<<' else -aRight))
+            return TExpression.wrap(aLeft << xShift) if xShift >= 0 else aLeft >> -xShift
+        if aOperator == '<':  return int(aLeft <  aRight)
+        if aOperator == '>':  return int(aLeft >  aRight)
+        if aOperator == '<=': return int(aLeft <= aRight)
+        if aOperator == '>=': return int(aLeft >= aRight)
+        if aOperator == '==': return int(aLeft == aRight)
+        if aOperator == '!=': return int(aLeft != aRight)
+        if aOperator == '&':  return aLeft & aRight
+        if aOperator == '^':  return aLeft ^ aRight
+        if aOperator == '|':  return aLeft | aRight
+        if aOperator == '&&': return int(bool(aLeft) and bool(aRight))
+        return int(bool(aLeft) or bool(aRight))
+        
+# ------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------
+class TContext:
+    """ TContext is the state of one file translation. The parser keeps the settings
+    shared by all files, so files could be translated in independent processes. 
+    mStats holds the counters and the timers in seconds for the stats report """
+    gStatKeys = ( 'bytes', 'lines', 'tokens', 'directives', 'blocks', 'functions', 'skipped',
+                  'time_read', 'time_tokenize', 'time_directives', 'time_write', 'time_total' )
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def __init__(self, aFqFileName, aDefines, aValues=None):
+        """ Initializes the context. Defines found in the file are added to a copy 
+        of aDefines. aValues maps defines to the integer value used in conditions """
+        self.mFqFileName   = aFqFileName
         self.mBlockList    = list()
-        self.mDefines      = ['SAPonNT']
-        self.mUndefines    = ['NATIVE_BEGIN', 'NATIVE_END', 'TRY_MAIN', 'EXCEPT_MAIN']
+        self.mDefines      = set(aDefines)
+        self.mValues       = dict(aValues or dict())
+        self.mProcess      = True   # Processing state of the innermost macro block
         self.mLine         = 0
         self.mPackage      = str()
         self.mClass        = str()
         
         self.mSkipNext     = False
         self.mSkipAll      = False
+        self.mError        = None
+        self.mLimit        = None   # Exceeded limit: The file is passed unchanged
+        self.mUnchanged    = False  # Skipped by an incremental run
+        self.mEntry        = None   # Manifest entry of an incremental run
+        self.mStats        = dict.fromkeys(self.gStatKeys, 0)
+        self.mSymbols      = list()   # Symbol table entries of TParser.mIds
+        self.mIndex        = list()   # Function records of TParser.mIndexFile
+        self.mDepth        = 0        # Include depth of a header, see TParser.headerEffects
+        self.mHeaders      = dict()   # Applied headers with size and modification time
+        
+# ------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------
+class TManifest:
+    """ TManifest is the persistent index of an incremental run, stored as JSON in the 
+    project root. For each file it keeps the hash of the original and the instrumented
+    content, the defines, the file stats and the stats of the applied headers. Entries 
+    are only valid for the same tool version and defines """
+    gFileName = '.sherlok_manifest.json'
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def __init__(self, aRoot, aDefines):
+        """ Initializes an empty manifest for the project root aRoot """
+        self.mRoot        = aRoot
+        self.mFqFileName  = os.path.join(aRoot, self.gFileName)
+        self.mVersion     = self.toolVersion()
+        self.mDefines     = sorted(set(aDefines))
+        self.mEntries     = dict()
+        
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    @staticmethod
+    def toolVersion():
+        """ The version is combined with the hash of this module, so any change of the 
+        translation invalidates the manifest """
+        with open(__file__, 'rb') as xFile:
+            return '{}-{}'.format(__version__, hashlib.sha1(xFile.read()).hexdigest()[:12])
+        
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    @staticmethod
+    def hashFile(aFqFileName):
+        """ Return the SHA-1 of the file content """
+        with open(aFqFileName, 'rb') as xFile:
+            return hashlib.sha1(xFile.read()).hexdigest()
+        
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    @staticmethod
+    def statFiles(aFqFileName):
+        """ Return size and modification time of the original and the instrumented file """
+        xStatIn  = os.stat(aFqFileName + '.orig')
+        xStatOut = os.stat(aFqFileName)
+        return [xStatIn.st_size, xStatIn.st_mtime_ns, xStatOut.st_size, xStatOut.st_mtime_ns]
+        
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def load(self):
+        """ Read the manifest. A missing, unreadable or outdated manifest is empty """
+        try:
+            with open(self.mFqFileName, 'r') as xFile:
+                xManifest = json.load(xFile)
+            if xManifest.get('version') == self.mVersion:
+                self.mEntries = xManifest.get('files', dict())
+        except (OSError, ValueError):
+            self.mEntries = dict()
+        return self
+            
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def save(self):
+        """ Write the manifest to a temporary file and replace the old one """
+        xFqFileTmp = self.mFqFileName + '.tmp'
+        with open(xFqFileTmp, 'w') as xFile:
+            json.dump({'version': self.mVersion, 'files': self.mEntries}, xFile, indent=1, sort_keys=True)
+        os.replace(xFqFileTmp, self.mFqFileName)
+        
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def lookup(self, aFqFileName):
+        """ Return the entry of aFqFileName, if it was translated with the same defines """
+        xEntry = self.mEntries.get(os.path.relpath(aFqFileName, self.mRoot))
+        if xEntry and xEntry.get('defines') == self.mDefines:
+            return xEntry
+        return None
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def update(self, aContext):
+        """ Store the entry of a translated or unchanged file, remove failed files """
+        xRelPath = os.path.relpath(aContext.mFqFileName, self.mRoot)
+        if aContext.mEntry and not aContext.mError:
+            self.mEntries[xRelPath] = aContext.mEntry
+        else:
+            self.mEntries.pop(xRelPath, None)
+        
+# ------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------
+class TIndex:
+    """ TIndex is the function index of a run: one record per instrumented function with
+    file, line of the body, package, class, method, signature and the ID of TParser.mIds.
+    Files with an extension of gSqlite are SQLite databases with the table functions,
+    other files have one JSON object per line """
+    gSqlite  = ('.db', '.sqlite', '.sqlite3')
+    gColumns = ('file', 'line', 'package', 'class', 'method', 'signature', 'id')
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def __init__(self, aFqFileName):
+        """ Initializes the index for aFqFileName, the file is opened by open """
+        self.mFqFileName = aFqFileName
+        self.mSqlite     = os.path.splitext(aFqFileName)[1].lower() in self.gSqlite
+        self.mFile       = None
+        
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def open(self, aAppend=False):
+        """ Open the index. Without aAppend the records of a previous run are removed """
+        if self.mSqlite:
+            self.mFile = sqlite3.connect(self.mFqFileName, timeout=60)
+            self.mFile.execute('create table if not exists functions ({})'.format(
+                'file text, line integer, package text, class text, method text, signature text, id text'))
+            self.mFile.execute('create index if not exists functions_method on functions (method, class)')
+            if not aAppend:
+                self.mFile.execute('delete from functions')
+        else:
+            self.mFile = open(self.mFqFileName, 'a' if aAppend else 'w')
+        return self
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def write(self, aContext):
+        """ Write the records of a translated file. Records found for several targets 
+        are written once, a failed file has no records """
+        if aContext.mError or aContext.mLimit or not aContext.mIndex:
+            return
+        xRecords = [(aContext.mFqFileName,) + xRecord for xRecord in dict.fromkeys(aContext.mIndex)]
+        if self.mSqlite:
+            self.mFile.executemany('insert into functions values (?,?,?,?,?,?,?)', xRecords)
+        else:
+            # Filter processes append to the same file: One write per file
+            self.mFile.write(''.join(json.dumps(dict(zip(self.gColumns, xRecord))) + '\n' for xRecord in xRecords))
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def close(self):
+        """ Commit and close the index """
+        if self.mSqlite:
+            self.mFile.commit()
+        self.mFile.close()
+        self.mFile = None
+        
+# ------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------
+class TTarget:
+    """ TTarget is one configuration of a multi-configuration run: the output directory
+    and the defines used to evaluate the conditional blocks """
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def __init__(self, aOutDir, aDefines, aValues):
+        """ Initializes the target with copies of aDefines and aValues """
+        self.mOutDir  = aOutDir
+        self.mDefines = set(aDefines)
+        self.mValues  = dict(aValues)
+        
+# ------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------
+class TRules:
+    """ TRules selects the functions to instrument. The rules file has one rule per
+    line, # starts a comment:
+        include|exclude [package=REGEX] [class=REGEX] [method=REGEX] [rate=N]
+        maxbody LINES
+        trivial
+    The include and exclude rules are checked in order and the first rule matching 
+    package, class and method decides. Functions without a matching rule are 
+    instrumented. rate is the sampling rate of included functions in the symbol 
+    table of TParser.mIds. maxbody skips functions with at most LINES lines in the body, 
+    trivial skips empty bodies and bodies with a single return statement. Both are 
+    checked at the end of each instrumented function """
+    gTrivialPattern = re.compile(r'\{\s*(?:return\b[^;{}]*;\s*)?\}')
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def __init__(self):
+        """ Initializes an empty rule set, which includes all functions """
+        self.mRules    = list()   # Tuples of include flag, the patterns and the rate
+        self.mMaxBody  = -1
+        self.mTrivial  = False
+        self.mDigest   = str()
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def load(self, aFqFileName):
+        """ Read the rules file and return self. Errors raise TranslateException """
+        with open(aFqFileName, 'r') as xFile:
+            xText = xFile.read()
+        self.mDigest = hashlib.sha1(xText.encode()).hexdigest()[:12]
+        
+        for xLineNo, xLine in enumerate(xText.splitlines(), 1):
+            xWords = xLine.split('#', 1)[0].split()
+            if not xWords:
+                continue
+            try:
+                if xWords[0] in ('include', 'exclude'):
+                    xPatterns = dict.fromkeys(('package', 'class', 'method'))
+                    xRate     = 1
+                    for xWord in xWords[1:]:
+                        xKey, xSep, xValue = xWord.partition('=')
+                        if xKey == 'rate' and xSep and int(xValue) > 0:
+                            xRate = int(xValue)
+                        elif xKey in xPatterns and xSep:
+                            xPatterns[xKey] = re.compile(xValue)
+                        else:
+                            raise ValueError('invalid condition {}'.format(xWord))
+                    self.mRules.append((xWords[0] == 'include', xPatterns['package'], xPatterns['class'], xPatterns['method'], xRate))
+                elif xWords[0] == 'maxbody' and len(xWords) == 2:
+                    self.mMaxBody = int(xWords[1])
+                elif xWords[0] == 'trivial' and len(xWords) == 1:
+                    self.mTrivial = True
+                else:
+                    raise ValueError('unknown rule {}'.format(xWords[0]))
+            except (ValueError, re.error) as xEx:
+                raise TranslateException('{}: file {}:{}'.format(xEx, aFqFileName, xLineNo))
+        return self
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def isIncluded(self, aPackage, aClass, aMethod):
+        """ Apply the include and exclude rules at the begin of a function """
+        return self.findRule(aPackage, aClass, aMethod)[0]
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def sampleRate(self, aPackage, aClass, aMethod):
+        """ Return the sampling rate of an included function """
+        return self.findRule(aPackage, aClass, aMethod)[4]
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def findRule(self, aPackage, aClass, aMethod):
+        """ Return the first rule matching the function or the default rule """
+        for xRule in self.mRules:
+            xInclude, xPackage, xClass, xMethod, xRate = xRule
+            if xPackage and not xPackage.search(aPackage):
+                continue
+            if xClass and not xClass.search(aClass):
+                continue
+            if xMethod and not xMethod.search(aMethod):
+                continue
+            return xRule
+        return (True, None, None, None, 1)
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def hasBodyRules(self):
+        """ Check if the body of a function has to be checked at its end """
+        return self.mMaxBody >= 0 or self.mTrivial
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def isSmall(self, aBuffer, aStart, aEnd):
+        """ Apply maxbody and trivial to the body between the brackets at aStart and aEnd """
+        if self.mMaxBody >= 0 and self.bodyLines(aBuffer, aStart, aEnd) <= self.mMaxBody:
+            return True
+        return self.mTrivial and self.gTrivialPattern.fullmatch(aBuffer, aStart, aEnd + 1) is not None
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    @staticmethod
+    def bodyLines(aBuffer, aStart, aEnd):
+        """ Return the number of lines between the brackets at aStart and aEnd. The 
+        lines of the brackets count only, if they have other text
+        
+        >>> TRules.bodyLines('{\\n    x = a;\\n}', 0, 13)
+        1
+        >>> [TRules.bodyLines(x, 0, len(x) - 1) for x in ['{}', '{ x; }', '{ x;\\n  y; }', '{\\n}']]
+        [0, 1, 2, 0]
+        """
+        xFirst = aBuffer.find('\n', aStart, aEnd)
+        if xFirst < 0:
+            return 0 if aBuffer[aStart + 1:aEnd].isspace() or aStart + 1 == aEnd else 1
+        
+        xLast  = aBuffer.rfind('\n', aStart, aEnd)
+        xLines = aBuffer.count('\n', xFirst, xLast) + 2
+        if not aBuffer[aStart + 1:xFirst].strip():
+            xLines -= 1
+        if not aBuffer[xLast + 1:aEnd].strip():
+            xLines -= 1
+        return xLines
+    
+# ------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------
+class TParser:
+    """ Reads files from an input directory and injects sherlok statements """
+    gExtensions  = ['.c', '.cpp', '.h', '.hpp']
+    gSkipDirs    = ['.git', '.svn', '.hg', '.bzr', 'CVS']
+    gSkipFiles   = ['cti.h', 'cti.cpp']
+    gSkipSuffix  = ('.orig', '.sherlok')
+    gMapSize     = 32 << 20    # Files from this size on are read by mmap
+    gSlowest     = 20          # Number of files in the stats report
+    gSymbolFile  = 'cti_symbols.txt'
+    gIncludeDepth = 32         # Nesting limit of headers without include guard
+    gIncludeFiles = dict()     # Resolved headers of this process, see findHeader
+    gHeaderCache  = dict()     # Define effects of headers of this process, see headerEffects
+    gHeaderFiles  = dict()     # Preprocessor statements and include guard of headers
+    gLimitCheck   = 4096       # Tokens between the checks of mLimits
+    gLimits       = { 'tokens' : 1 << 20,    # Length of the token list of a declaration
+                      'depth'  : 1 << 16,    # Nesting depth of blocks
+                      'carry'  : 16 << 20,   # Size of a comment, string or macro carried over lines
+                      'seconds': 60.0 }      # Time of one translation
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def __init__(self, aInFile, aSherlokSrc, aJobs=1, aIncludes=None, aExcludes=None, aExtensions=None, aIncremental=False):
+        """ aInFile could be a directory or single file 
+        aOutFile is a directory 
+        aJobs is the number of processes for translateProject, 0 is one per CPU 
+        aIncludes, aExcludes are glob patterns for the path relative to aInFile
+        aExtensions are the extensions of source files, default is gExtensions 
+        aIncremental skips files, which are unchanged since the last run """
+        self.mInFile       = aInFile
+        self.mSherlokSrc   = aSherlokSrc
+        self.mDefines      = {'SAPonNT'}
+        self.mValues       = dict()
+        self.mUndefines    = {'NATIVE_BEGIN', 'NATIVE_END', 'TRY_MAIN', 'EXCEPT_MAIN'}
+        self.mTargets      = list()
+        self.mProjectRoot  = str()
+        self.mStats        = None   # Format of the stats report: text or json
+        self.mRules        = None   # Selective instrumentation
+        self.mIds          = False  # Inject function IDs and write the symbol table
+        self.mIndexFile    = None   # Write the function index, see TIndex
+        self.mIncludePath  = list() # Apply the defines of included headers, see directiveInclude
+        self.mLimits       = dict(self.gLimits)
+        self.mStatsFile    = None
+        self.mJobs         = aJobs or os.cpu_count() or 1
+        self.mIncludes     = list(aIncludes or [])
+        self.mExcludes     = list(aExcludes or [])
+        self.mExtensions   = set(aExtensions or self.gExtensions)
+        self.mIncremental  = aIncremental
+        
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    @staticmethod
+    def parseDefines(aDefineList, aDefines, aValues):
+        """ Add the NAME[=VALUE] items of aDefineList to the set aDefines. Integer 
+        values are stored in aValues as for #define """
+        for xDefine in aDefineList:
+            xName, xSep, xValue = xDefine.partition('=')
+            xName = xName.strip()
+            if not xName:
+                raise TranslateException('invalid define: {}'.format(xDefine))
+            aDefines.add(xName)
+            aValues.pop(xName, None)
+            if xSep:
+                xNumber = TExpression.toNumber(xValue.strip())
+                if xNumber is not None:
+                    aValues[xName] = xNumber
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def setDefines(self, aDefines=None, aUndefines=None):
+        """ Apply the -D and -U options: aDefines are NAME[=VALUE] items added to the 
+        predefined names, aUndefines are removed """
+        self.parseDefines(aDefines or [], self.mDefines, self.mValues)
+        for xName in aUndefines or []:
+            self.mDefines.discard(xName)
+            self.mValues.pop(xName, None)
+            
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def addTarget(self, aOutDir, aDefines=None):
+        """ Add a configuration, which writes to aOutDir. The defines of the parser are
+        extended by the NAME[=VALUE] items of aDefines """
+        xTarget = TTarget(aOutDir, self.mDefines, self.mValues)
+        self.parseDefines(aDefines or [], xTarget.mDefines, xTarget.mValues)
+        self.mTargets.append(xTarget)
+        
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def setStats(self, aFormat, aFqFileName=None):
+        """ Write a stats report in aFormat text or json after translateFiles. The 
+        report is written to aFqFileName or stdout """
+        if aFormat not in (None, 'text', 'json'):
+            raise TranslateException('invalid stats format: {}'.format(aFormat))
+        self.mStats     = aFormat
+        self.mStatsFile = aFqFileName
+        
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def setLimits(self, aLimitList=None):
+        """ Set the NAME=VALUE items of aLimitList for pathological input, see gLimits. 
+        Sizes accept the suffix K and M """
+        for xLimit in aLimitList or []:
+            xName, xSep, xValue = xLimit.partition('=')
+            if xName not in self.gLimits or not xSep:
+                raise TranslateException('invalid limit: {}, the names are {}'.format(xLimit, ', '.join(sorted(self.gLimits))))
+            self.mLimits[xName] = TCorpus.toValue(xValue, type(self.gLimits[xName]))
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def limitException(self, aName, aValue):
+        """ Return the exception for aValue exceeding the limit aName """
+        return TLimitException('{} limit {} exceeded by {}'.format(aName, self.mLimits[aName], aValue))
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def checkLimits(self, aContext, aTokenList, aStart):
+        """ Raise TLimitException, if the token list, the block depth or the time of 
+        a translation started at aStart exceeds mLimits """
+        if len(aTokenList) > self.mLimits['tokens']:
+            raise self.limitException('tokens', len(aTokenList))
+        if len(aContext.mBlockList) > self.mLimits['depth']:
+            raise self.limitException('depth', len(aContext.mBlockList))
+        xElapsed = time.perf_counter() - aStart
+        if xElapsed > self.mLimits['seconds']:
+            raise self.limitException('seconds', round(xElapsed, 3))
+        
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def setRules(self, aFqFileName):
+        """ Read the rules for selective instrumentation from aFqFileName """
+        self.mRules = TRules().load(aFqFileName) if aFqFileName else None
+        
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def manifestKey(self):
+        """ The settings, which invalidate the entries of an incremental run """
+        xKey = self.defineList(self.mDefines, self.mValues)
+        if self.mRules:
+            xKey.append('@rules=' + self.mRules.mDigest)
+        if self.mIds:
+            xKey.append('@ids')
+        if self.mIndexFile:
+            xKey.append('@index')
+        for xDir in self.mIncludePath:
+            xKey.append('@include=' + xDir)
+        return sorted(xKey)
+        
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    @staticmethod
+    def functionId(aPackage, aClass, aMethod, aSignature):
+        """ The ID of a function is derived from its name and signature, so it is 
+        stable for independent processes and runs """
+        xName = '{}/{}/{}/{}'.format(aPackage, aClass, aMethod, aSignature)
+        return '0x{}ULL'.format(hashlib.sha1(xName.encode()).hexdigest()[:16])
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def writeSymbols(self, aContextList):
+        """ Merge the symbols of aContextList into the symbol table of each output 
+        root. The table has one line per ID with package, class, method, signature 
+        and sampling rate separated by tabs """
+        xOutDirList = [xTarget.mOutDir for xTarget in self.mTargets] or [self.mProjectRoot]
+        for xOutDir in dict.fromkeys(os.path.normpath(xOutDir) for xOutDir in xOutDirList):
+            xFqFileName = os.path.join(xOutDir, self.gSymbolFile)
+            xSymbols    = dict()
+            try:
+                with open(xFqFileName, 'r') as xFile:
+                    for xLine in xFile:
+                        if not xLine.startswith('#') and xLine.strip():
+                            xSymbols[xLine.split('\t', 1)[0]] = xLine.rstrip('\n')
+            except OSError:
+                pass
+            
+            for xContext in aContextList:
+                for xSymbol in xContext.mSymbols:
+                    xSymbols[xSymbol[0]] = '\t'.join(str(xItem) for xItem in xSymbol)
+            
+            xHeader = '# id\tpackage\tclass\tmethod\tsignature\trate\n'
+            self.writeOutput(xFqFileName, xHeader + ''.join(xSymbols[xId] + '\n' for xId in sorted(xSymbols)))
+            
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    @staticmethod
+    def defineList(aDefines, aValues):
+        """ Return the defines as sorted list of NAME or NAME=VALUE """
+        return sorted(xName if xName not in aValues else '{}={}'.format(xName, aValues[xName]) 
+                      for xName in aDefines)
         
     # --------------------------------------------------------------------------------
     # --------------------------------------------------------------------------------            
     def translateProject(self):
-        """ Translate all files from input directory """ 
+        """ Translate all files from input directory. With targets the files are
+        written to the output directory of each target instead of in place """ 
         xProjectRoot = str()
         
         if os.path.isdir(self.mInFile):
-            xGenDir      = os.walk(self.mInFile)
-            xDirEntry    = xGenDir.__next__()
-            xProjectRoot = xDirEntry[0]
-            
-            for xFile in xDirEntry[2]:
-                xFqFileName = os.path.join(xDirEntry[0], xFile)
-                self.translateOneFile(xFqFileName)
-            
+            xProjectRoot = self.mInFile
+            xFileList    = self.findFiles(self.mInFile)
         else:
             xProjectRoot = os.path.split(self.mInFile)[0]
-            self.translateOneFile(self.mInFile)
+            xFileList    = [self.mInFile] if self.isSourceFile(self.mInFile) else []
 
         if not xProjectRoot:
             xProjectRoot = '.'
+        self.mProjectRoot = xProjectRoot
         
-        if os.path.exists( os.path.join(self.mSherlokSrc, 'cti.h') ):
-            shutil.copy( os.path.join(self.mSherlokSrc, 'cti.h'), xProjectRoot ) 
-            
-        if os.path.exists( os.path.join(self.mSherlokSrc, 'cti.cpp') ):
-            shutil.copy( os.path.join(self.mSherlokSrc, 'cti.cpp'), xProjectRoot ) 
+        xManifest = None
+        if self.mIncremental and not self.mTargets:
+            xManifest = TManifest(xProjectRoot, self.manifestKey()).load()
             
+        self.translateFiles(xFileList, xManifest)
+        
+        if not self.mTargets:
+            if os.path.exists( os.path.join(self.mSherlokSrc, 'cti.h') ):
+                shutil.copy( os.path.join(self.mSherlokSrc, 'cti.h'), xProjectRoot ) 
+                
+            if os.path.exists( os.path.join(self.mSherlokSrc, 'cti.cpp') ):
+                shutil.copy( os.path.join(self.mSherlokSrc, 'cti.cpp'), xProjectRoot ) 
+            return
+        
+        # Copy once per output root, unchanged files are kept 
+        for xOutDir in dict.fromkeys(os.path.normpath(xTarget.mOutDir) for xTarget in self.mTargets):
+            for xFile in self.gSkipFiles:
+                xFqFileName = os.path.join(self.mSherlokSrc, xFile)
+                if os.path.exists(xFqFileName):
+                    with open(xFqFileName, 'rb') as xInFile:
+                        self.writeOutput(os.path.join(xOutDir, xFile), xInFile.read())
             
     # --------------------------------------------------------------------------------
     # --------------------------------------------------------------------------------            
-    def translateOneFile(self, aFqFileName):
-        xAlreadyTranslated = False
+    def restoreProject(self):
+        """ Undo the translation in place: Replace the files of the input directory by 
+        their .orig copy. The originals are found in one scan and restored by mJobs 
+        threads. Files changed since the translation are reported and kept. Only if all 
+        files are restored the copied files gSkipFiles, the manifest and gSymbolFile are 
+        removed, otherwise TranslateException is raised """
+        xStart = time.monotonic()
+        if self.mTargets:
+            raise TranslateException('restore works in place, the targets are not changed')
         
-        xExtension = os.path.splitext(aFqFileName)
-        if xExtension[-1] not in ['.c', '.cpp', '.h', '.hpp']:
-            return
+        if os.path.isdir(self.mInFile):
+            xProjectRoot = self.mInFile
+            xFileList    = self.findFiles(self.mInFile, '.orig')
+        else:
+            xProjectRoot = os.path.split(self.mInFile)[0] or '.'
+            xFileList    = [self.mInFile] if os.path.isfile(self.mInFile + '.orig') else []
         
-        with open(aFqFileName,  "r") as xInFile:
-            xBuffer  = xInFile.readline()
-            # Already translated file: Reset and try again
-            if 'cti.h' in xBuffer:
-                xAlreadyTranslated = True
+        if self.mJobs > 1:
+            with ThreadPoolExecutor(max_workers=self.mJobs) as xPool:
+                xErrorList = list(xPool.map(self.restoreOneFile, xFileList))
+        else:
+            xErrorList = list(map(self.restoreOneFile, xFileList))
+        
+        # The kept files still include cti.h
+        xFailed = [xError for xError in xErrorList if xError]
+        if os.path.isdir(self.mInFile) and not xFailed:
+            for xFile in self.gSkipFiles + [TManifest.gFileName, self.gSymbolFile]:
+                xFqFileName = os.path.join(xProjectRoot, xFile)
+                if os.path.isfile(xFqFileName):
+                    os.remove(xFqFileName)
         
-        if xAlreadyTranslated:
+        print('restored {} files, {} mismatches, {:.1f} s'.format(
+            len(xErrorList) - len(xFailed), len(xFailed), time.monotonic() - xStart))
+        for xError in xFailed:
+            print(xError)
+            
+        if xFailed:
+            raise TranslateException('{} of {} files not restored'.format(len(xFailed), len(xErrorList)))
+        return len(xErrorList)
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def restoreOneFile(self, aFqFileName):
+        """ Replace aFqFileName by its .orig copy. Only the first line is read to check 
+        the translation. Returns an error message for a mismatch, the file and the 
+        copy are kept in this case """
+        try:
+            with open(aFqFileName, 'rb') as xFile:
+                if b'cti.h' not in xFile.readline(256):
+                    return 'not instrumented, kept with .orig: file {}'.format(aFqFileName)
+        except FileNotFoundError:
+            pass
+        except OSError as xEx:
+            return '{}: file {}'.format(xEx, aFqFileName)
+        
+        try:
+            os.replace(aFqFileName + '.orig', aFqFileName)
+        except OSError as xEx:
+            return '{}: file {}'.format(xEx, aFqFileName)
+        return None
+            
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def findFiles(self, aRoot, aSuffix=str()):
+        """ Generator for the source files in aRoot and all sub-directories. Files of a 
+        directory are returned in sorted order before its sub-directories are entered.
+        Directories matching an exclude pattern are not entered. With aSuffix like 
+        .orig only sources with this companion file are returned """
+        xDirList = [(aRoot, str())]
+        
+        while xDirList:
+            xDir, xRelDir = xDirList.pop()
             try:
-                os.replace(aFqFileName + '.orig', aFqFileName)  
-            except Exception as xEx:
-                raise
+                with os.scandir(xDir) as xScan:
+                    xEntryList = sorted(xScan, key=lambda xEntry: xEntry.name)
+            except OSError:
+                continue
             
-        xFqFileTmp     =  aFqFileName + '.sherlok'    
-        xDir,  xFile   = os.path.split(aFqFileName)
-        xBase, xExt    = os.path.splitext(xFile)
-
-        self.mPackage  = xDir.split(os.sep + 'src' + os.sep)[-1].replace(os.sep, '.')
-        self.mClass    = xBase
+            xSubDirList = list()
+            for xEntry in xEntryList:
+                xRelPath = xRelDir + xEntry.name
+                
+                if xEntry.is_dir(follow_symlinks=False):
+                    if xEntry.name in self.gSkipDirs or self.isExcluded(xRelPath):
+                        continue
+                    # Output directories inside the input tree
+                    if self.mTargets and self.isOutDir(xEntry.path):
+                        continue
+                    xSubDirList.append((xEntry.path, xRelPath + '/'))
+                elif aSuffix:
+                    if xEntry.name.endswith(aSuffix) and self.isSourceFile(xEntry.name[:-len(aSuffix)]):
+                        if self.isIncluded(xRelPath[:-len(aSuffix)]) and xEntry.is_file():
+                            yield xEntry.path[:-len(aSuffix)]
+                elif xEntry.is_file() and self.isSourceFile(xEntry.name):
+                    if self.isIncluded(xRelPath):
+                        yield xEntry.path
+                        
+            xDirList.extend(reversed(xSubDirList))
+            
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def isOutDir(self, aPath):
+        """ Check if aPath is the output directory of a target """
+        xPath = os.path.abspath(aPath)
+        return any(os.path.abspath(xTarget.mOutDir) == xPath for xTarget in self.mTargets)
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def isSourceFile(self, aFileName):
+        """ Check the extension and skip sherlok artifacts """
+        xName = os.path.basename(aFileName)
+        if xName in self.gSkipFiles or xName.endswith(self.gSkipSuffix):
+            return False
+        return os.path.splitext(xName)[-1] in self.mExtensions
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def isExcluded(self, aRelPath):
+        """ Check aRelPath against the exclude patterns """
+        return any(fnmatch.fnmatch(aRelPath, xPattern) for xPattern in self.mExcludes)
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def isIncluded(self, aRelPath):
+        """ Check aRelPath against the include and exclude patterns. Without include 
+        patterns all files are included """
+        if self.isExcluded(aRelPath):
+            return False
+        if not self.mIncludes:
+            return True
+        return any(fnmatch.fnmatch(aRelPath, xPattern) for xPattern in self.mIncludes)
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def translateFiles(self, aFileList, aManifest=None):
+        """ Translate all files of aFileList on mJobs processes. aFileList could be a 
+        generator, translation starts with the first file. The contexts are collected 
+        in the order of aFileList, so the report does not depend on the scheduling. 
+        aManifest provides the entries of an incremental run and is saved at the end.
+        Raises TranslateException after all files, if any file failed """
+        xContextList = list()
+        xErrorList   = list()
+        xLimitList   = list()
+        xUnchanged   = 0
+        xStart       = time.monotonic()
+        xNextReport  = xStart + 1.0
         
-        print('translate {}'.format(aFqFileName))
-
-        try:            
-            with open(aFqFileName,  "r") as xInFile:
-                with open(xFqFileTmp, "w") as xOutFile:
-                    self.translate(xInFile, xOutFile)
+        xFileList, xEntryList = itertools.tee(aFileList)
+        xEntryList = map(aManifest.lookup if aManifest else lambda xFile: None, xEntryList)
+        xTranslate = self.translateTargets if self.mTargets else self.translateOneFile
+        xIndex     = TIndex(self.mIndexFile).open() if self.mIndexFile else None
+        
+        if self.mJobs > 1:
+            xPool    = ProcessPoolExecutor(max_workers=self.mJobs)
+            xResults = xPool.map(xTranslate, xFileList, xEntryList, chunksize=8)
+        else:
+            xPool    = None
+            xResults = map(xTranslate, xFileList, xEntryList)
+            
+        try:
+            for xContext in xResults:
+                xContextList.append(xContext)
+                if xContext.mError:
+                    xErrorList.append(xContext.mError)
+                if xContext.mLimit:
+                    xLimitList.append(xContext.mLimit)
+                if xContext.mUnchanged:
+                    xUnchanged += 1
+                if aManifest:
+                    aManifest.update(xContext)
+                if xIndex:
+                    xIndex.write(xContext)
+                
+                if time.monotonic() >= xNextReport:
+                    xNextReport = time.monotonic() + 1.0
+                    print('translate {} files, {} unchanged, {} passed, {} errors, {:.1f} s'.format(
+                        len(xContextList), xUnchanged, len(xLimitList), len(xErrorList), time.monotonic() - xStart))
+        finally:
+            if xPool:
+                xPool.shutdown()
+            if aManifest:
+                aManifest.save()
+            if xIndex:
+                xIndex.close()
+                
+        print('translated {} files, {} unchanged, {} passed, {} errors, {:.1f} s'.format(
+            len(xContextList), xUnchanged, len(xLimitList), len(xErrorList), time.monotonic() - xStart))
+        
+        if self.mStats:
+            self.writeStats(xContextList, time.monotonic() - xStart)
+        if self.mIds:
+            self.writeSymbols(xContextList)
+        
+        # Files exceeding a limit are passed unchanged and do not fail the run
+        for xLimit in xLimitList:
+            print('passed unchanged, {}'.format(xLimit))
+        for xError in xErrorList:
+            print(xError)
+        
+        if xErrorList:
+            raise TranslateException('{} of {} files failed'.format(len(xErrorList), len(xContextList)))
+        return xContextList
+            
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def writeStats(self, aContextList, aElapsed):
+        """ Write the totals of the counters and timers and the gSlowest files. The 
+        timers are the sum over all files, so with jobs they exceed the elapsed time """
+        xTotals = dict.fromkeys(TContext.gStatKeys, 0)
+        for xContext in aContextList:
+            for xKey, xValue in xContext.mStats.items():
+                xTotals[xKey] += xValue
+        
+        xSlowest = sorted(aContextList, key=lambda xContext: xContext.mStats['time_total'], reverse=True)
+        xReport  = { 'files'    : len(aContextList),
+                     'errors'   : sum(1 for xContext in aContextList if xContext.mError),
+                     'unchanged': sum(1 for xContext in aContextList if xContext.mUnchanged),
+                     'passed'   : sum(1 for xContext in aContextList if xContext.mLimit),
+                     'jobs'     : self.mJobs,
+                     'elapsed'  : round(aElapsed, 4),
+                     'totals'   : self.roundStats(xTotals),
+                     'slowest'  : [ dict(self.roundStats(xContext.mStats), file=xContext.mFqFileName) 
+                                    for xContext in xSlowest[:self.gSlowest] ] }
+        
+        xOutFile = open(self.mStatsFile, 'w') if self.mStatsFile else sys.stdout
+        try:
+            if self.mStats == 'json':
+                xOutFile.write(json.dumps(xReport, indent=1, sort_keys=True) + '\n')
+                return
+            
+            xOutFile.write('stats {files} files, {errors} errors, {unchanged} unchanged, {passed} passed, {jobs} jobs, {elapsed:.1f} s\n'.format(**xReport))
+            xOutFile.write(' '.join('{}={}'.format(xKey, xValue) for xKey, xValue in xReport['totals'].items()) + '\n')
+            for xStats in xReport['slowest']:
+                xOutFile.write('{time_total:8.3f} s {bytes:>10} bytes {tokens:>8} tokens {directives:>6} directives  {file}\n'.format(**xStats))
+        finally:
+            if xOutFile is not sys.stdout:
+                xOutFile.close()
+            
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    @staticmethod
+    def roundStats(aStats):
+        """ Return a copy of aStats with the timers rounded to 0.1 ms """
+        return { xKey: round(xValue, 4) if xKey.startswith('time_') else xValue 
+                 for xKey, xValue in aStats.items() }
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def translateOneFile(self, aFqFileName, aEntry=None):
+        """ Translate one file in place and keep the original as .orig. Returns the 
+        context of the file with mError set on failure. In an incremental run the file
+        is skipped, if the original and the instrumented file still match aEntry """
+        xContext = self.newContext(aFqFileName, self.mDefines, self.mValues)
+        xStats   = xContext.mStats
+        xStart   = time.perf_counter()
+        
+        try:
+            if aEntry and self.isUnchanged(aFqFileName, aEntry, xContext):
+                xContext.mUnchanged = True
+                xContext.mSymbols   = [tuple(xSymbol) for xSymbol in aEntry.get('symbols', [])]
+                xContext.mIndex     = [tuple(xRecord) for xRecord in aEntry.get('index', [])]
+                xStats['time_total'] = time.perf_counter() - xStart
+                return xContext
+            
+            xBuffer = self.readSource(aFqFileName)
+            
+            # Already translated file: Reset and try again
+            if 'cti.h' in xBuffer[:xBuffer.find('\n') + 1 or None]:
+                os.replace(aFqFileName + '.orig', aFqFileName)  
+                xBuffer = self.readSource(aFqFileName)
+            xStats['bytes']     = len(xBuffer)
+            xStats['time_read'] = time.perf_counter() - xStart
+                
+            xFqFileTmp     =  aFqFileName + '.sherlok'    
+            
+            # The temporary file is only created for a successful translation
+            xOutput = ''.join(self.translateBuffer(xBuffer, xContext))
+            xStats['lines'] = xContext.mLine
+            
+            xWrite  = time.perf_counter()
+            with open(xFqFileTmp, "w") as xOutFile:
+                xOutFile.write(xOutput)
                         
             os.rename(aFqFileName, aFqFileName + '.orig')
             os.rename(xFqFileTmp,  aFqFileName)                        
+            
+            if self.mIncremental:
+                xContext.mEntry = { 'orig'   : TManifest.hashFile(aFqFileName + '.orig'),
+                                    'out'    : TManifest.hashFile(aFqFileName),
+                                    'defines': self.manifestKey(),
+                                    'symbols': xContext.mSymbols,
+                                    'index'  : xContext.mIndex,
+                                    'headers': xContext.mHeaders,
+                                    'stat'   : TManifest.statFiles(aFqFileName) }
+            xStats['time_write'] = time.perf_counter() - xWrite
+        except TLimitException as xEx:
+            # The original is kept
+            xContext.mLimit   = '{}: file {}:{}'.format(xEx, aFqFileName, xContext.mLine)
+            xContext.mSymbols = list()
+            xContext.mIndex   = list()
         except Exception as xEx:
-            print ('{}: file {}:{}'.format(xEx, aFqFileName, self.mLine))
-            raise
+            xContext.mError = '{}: file {}:{}'.format(xEx, aFqFileName, xContext.mLine)
+        
+        # The block list is not needed by the caller
+        xContext.mBlockList  = list()
+        xStats['time_total'] = time.perf_counter() - xStart
+        return xContext
 
     # --------------------------------------------------------------------------------
     # --------------------------------------------------------------------------------            
-    def translate(self, aInFile, aOutFile):
-        xTokenList      = list()
-        xLastToken      = ''     # Used to sync parser after reading a new block
-        xReadBlock      = None   # Contains the end sequence of a block
-        
-        xSkipNextToken  = False  # Skip token for method/function argument list
-        xQualifier      = str()  # Store qualifier * or & for an argument
-        xBuffer         = str()        
-        self.mBlockList = list()
+    def translateTargets(self, aFqFileName, aEntry=None):
+        """ Translate one file for all targets. The file is read once, a single target
+        is translated while tokenizing. Several targets scan the token positions once 
+        and match each token again at its position. The output is written to the 
+        relative path of the file in each output directory, the original is not 
+        changed. Returns the context of the last target or of the failed target """
+        xContext = self.newContext(aFqFileName, self.mDefines, self.mValues)
+        xStats   = xContext.mStats   # Shared by the contexts of all targets
+        xSymbols = xContext.mSymbols
+        xRecords = xContext.mIndex
+        xStart   = time.perf_counter()
         
-        xBlock          = TBlock(TBlock.DECLARATION, self.mClass)
-        self.mBlockList.append(xBlock)
+        try:
+            xBuffer = self.readSource(aFqFileName)
+            
+            # Translated in place before: Use the original
+            if 'cti.h' in xBuffer[:xBuffer.find('\n') + 1 or None]:
+                xBuffer = self.readSource(aFqFileName + '.orig')
+            xStats['bytes']     = len(xBuffer)
+            xStats['time_read'] = time.perf_counter() - xStart
                 
-        self.mLine      = 0        
-        aOutFile.write('#include "cti.h"\n')
-        
-        for xBuffer in aInFile:
-            self.mLine += 1
-
-            if xLastToken:
-                xBuffer    = xLastToken + xBuffer
-                xLastToken = None
-
-            xBufferLen = len(xBuffer)
-            xIndex     = 0
-            xInxFind   = 0
-            
-            while xIndex < xBufferLen:                 
-                # Read block. 
-                # If the block happens to exceed the buffer: 
-                # read a new chunk, restore the last token and continue
-                if xReadBlock:
-                    if xIndex + len(xReadBlock) > xBufferLen:
-                        xLastToken = xBlock[xIndex:]
-                        break
-                    
-                    xInxFind = xBuffer.find(xReadBlock, xInxFind)
-                    if xInxFind < 0:
-                        aOutFile.write(xBuffer[xIndex:])
-                        xLastToken = xBuffer[-1]
-                        break
-
-                    if xBuffer[xInxFind-1] == '\\':
-                        if xBuffer[xInxFind-2] != '\\':
-                            xInxFind += 1
-                            continue
-                    
-                    if xBuffer[xIndex:xInxFind]   == '/*CCQ_SHERLOK_SKIP_FCTN*/':
-                        self.mSkipNext = True                    
-                    elif xBuffer[xIndex:xInxFind] == '/*CCQ_SHERLOK_SKIP_FILE*/':
-                        self.mSkipAll  = True
-                    
-                    xInxFind += len(xReadBlock)
-                                        
-                    # Evaluate the macro blocks according to preprocessor statements. 
-                    # This is necessary for counting the brackets correctly
-                    while xBuffer[xIndex] == '#':                        
-                        xMacroStmt  = xBuffer[xIndex:xInxFind]
-
-                        if re.search('#\W*endif', xMacroStmt):
-                            xBlock = self.mBlockList.pop()
-                            break
+            # Several targets keep the token positions only, a match object per
+            # token would need many times the size of the file
+            xStarts   = None
+            xRelPath  = os.path.relpath(aFqFileName, self.mProjectRoot)
+            xWritten  = False
+            if len(self.mTargets) > 1:
+                xTokenize = time.perf_counter()
+                xStarts   = array.array('q', (xToken.start() for xToken in gTokenPattern.finditer(xBuffer)))
+                xStats['tokens']         = len(xStarts)
+                xStats['time_tokenize'] += time.perf_counter() - xTokenize
+            
+            for xTarget in self.mTargets:
+                xContext   = self.newContext(aFqFileName, xTarget.mDefines, xTarget.mValues)
+                xContext.mStats   = xStats
+                xContext.mSymbols = xSymbols
+                xContext.mIndex   = xRecords
+                xTokens    = None if xStarts is None else map(gTokenPattern.match, itertools.repeat(xBuffer), xStarts)
+                xOutput    = ''.join(self.translateBuffer(xBuffer, xContext, xTokens))
+                
+                xWrite     = time.perf_counter()
+                xWritten   = self.writeOutput(os.path.join(xTarget.mOutDir, xRelPath), xOutput) or xWritten
+                xStats['time_write'] += time.perf_counter() - xWrite
+            xStats['lines'] = xContext.mLine
+            
+            # All outputs are identical to the files on disk
+            xContext.mUnchanged = not xWritten
+        except TLimitException as xEx:
+            # The original is written to all targets
+            xContext.mLimit   = '{}: file {}:{}'.format(xEx, aFqFileName, xContext.mLine)
+            xContext.mSymbols = list()
+            xContext.mIndex   = list()
+            try:
+                for xTarget in self.mTargets:
+                    self.writeOutput(os.path.join(xTarget.mOutDir, xRelPath), xBuffer)
+            except Exception as xEx:
+                xContext.mError = '{}: file {}:{}'.format(xEx, aFqFileName, xContext.mLine)
+        except Exception as xEx:
+            xContext.mError = '{}: file {}:{}'.format(xEx, aFqFileName, xContext.mLine)
+            
+        xContext.mBlockList  = list()
+        xStats['time_total'] = time.perf_counter() - xStart
+        return xContext
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def writeOutput(self, aFqOutName, aOutput):
+        """ Write aOutput to a temporary file and replace aFqOutName. The file is not 
+        touched, if it has the same content, so its modification time is kept for 
+        the build. aOutput is text or bytes. Returns True, if the file was written """
+        xData = aOutput
+        if isinstance(xData, str):
+            if os.linesep != '\n':
+                xData = xData.replace('\n', os.linesep)
+            xData = xData.encode(locale.getpreferredencoding(False))
+        
+        try:
+            if os.path.getsize(aFqOutName) == len(xData):
+                with open(aFqOutName, 'rb') as xFile:
+                    if xFile.read() == xData:
+                        return False
+        except OSError:
+            os.makedirs(os.path.dirname(aFqOutName) or '.', exist_ok=True)
+            
+        xFqFileTmp = aFqOutName + '.sherlok'
+        with open(xFqFileTmp, 'wb') as xFile:
+            xFile.write(xData)
+        os.replace(xFqFileTmp, aFqOutName)
+        return True
+        
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def newContext(self, aFqFileName, aDefines, aValues):
+        """ Create the context of a file. Package and class are derived from the path """
+        xContext     = TContext(aFqFileName, aDefines, aValues)
+        xDir,  xFile = os.path.split(aFqFileName)
+        xBase, xExt  = os.path.splitext(xFile)
+        
+        xContext.mPackage = xDir.split(os.sep + 'src' + os.sep)[-1].replace(os.sep, '.')
+        xContext.mClass   = xBase
+        return xContext
+        
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def readSource(self, aFqFileName):
+        """ Read the complete file into one string. Large files are decoded directly 
+        from a memory mapping, saving the buffered copy of the file object """
+        if os.path.getsize(aFqFileName) < self.gMapSize:
+            with open(aFqFileName, "r") as xInFile:
+                return xInFile.read()
+        
+        with open(aFqFileName, "rb") as xInFile:
+            with mmap.mmap(xInFile.fileno(), 0, access=mmap.ACCESS_READ) as xMap:
+                xBuffer = str(xMap, locale.getpreferredencoding(False))
+        # Universal newlines as for text files 
+        return xBuffer.replace('\r\n', '\n').replace('\r', '\n')
 
-                        # inherit processing and environment
-                        # Macro blocks are nested independent from program logic
-                        for xBlockEnv in reversed(self.mBlockList):
-                            if xBlockEnv != TBlock.MACRO:
-                                break
-                            
-                        xProcess  = self.mBlockList[-1].doProcess()
-                                                            
-                        xMacroBlock = re.search('#\W*if\W*(defined)\W*(\w+)', xMacroStmt)
-                        if xMacroBlock:
-                            xBlock = TBlock( TBlock.MACRO, xMacroBlock.group(2), xBlockEnv )
-                            xBlock.conditionalBlock( xProcess and (xMacroBlock.group(2) in self.mDefines ))
-                            self.mBlockList.append(xBlock)
-                            break
-                        
-                        xMacroBlock = re.search('#\W*(ifdef)\W*(\w+)',  xMacroStmt)
-                        if xMacroBlock:
-                            xBlock = TBlock( TBlock.MACRO, xMacroBlock.group(2), xBlockEnv )
-                            xBlock.conditionalBlock( xProcess and (xMacroBlock.group(2) in self.mDefines ))
-                            self.mBlockList.append(xBlock)
-                            break
-                        
-                        xMacroBlock = re.search('#\W*(ifndef)\W*(\w+)', xMacroStmt)
-                        if xMacroBlock:
-                            xBlock = TBlock( TBlock.MACRO, xMacroBlock.group(2), xBlockEnv )
-                            xBlock.conditionalBlock( xProcess and (xMacroBlock.group(2) not in self.mDefines ))
-                            self.mBlockList.append(xBlock)
-                            break
-                        
-                        xMacroBlock = re.search('#\W*(if)\W*(\w+)', xMacroStmt)
-                        if xMacroBlock:
-                            xBlock = TBlock(TBlock.MACRO, "", xBlockEnv )
-                            xBlock.conditionalBlock( xProcess and (xMacroBlock.group(2) in '1' ))
-                            self.mBlockList.append(xBlock)
-                            break
-                                
-                        xBlock      = self.mBlockList[-1]
-                        xMacroBlock = re.search('(#\W*elif )(\w+)', xMacroStmt)
-                        if xMacroBlock:
-                            xCondition = xMacroBlock.group(2) in self.mDefines
-                            xBlock.conditionalBlock( xCondition )
-                            break
-                        
-                        if re.search('#\W*else', xMacroStmt):
-                            xBlock.conditionalBlock(True)
-                            break
-                                                
-                        xMacroBlock = re.search('(#\W*define\W*)(\w+)', xMacroStmt)
-                        if xMacroBlock:
-                            if xBlock.doProcess():
-                                self.mDefines.append( xMacroBlock.group(2) )
-                            break
-                        break
-                    
-                    aOutFile.write(xBuffer[xIndex:xInxFind])
-                    xReadBlock = None
-                    xIndex     = xInxFind
-                    continue
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def isUnchanged(self, aFqFileName, aEntry, aContext):
+        """ Compare the original and the instrumented file with the manifest entry. The 
+        stats are compared first, the content only if the stats differ. A changed 
+        header of the entry always needs a translation """
+        try:
+            xStat = TManifest.statFiles(aFqFileName)
+            for xHeader, xHeaderStat in aEntry.get('headers', dict()).items():
+                if self.statHeader(xHeader)[1] != xHeaderStat:
+                    return False
+        except OSError:
+            return False
+        
+        if xStat != aEntry['stat']:
+            if TManifest.hashFile(aFqFileName + '.orig') != aEntry['orig']:
+                return False
+            if TManifest.hashFile(aFqFileName) != aEntry['out']:
+                return False
+        
+        aContext.mEntry = dict(aEntry, stat=xStat)
+        return True
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def translate(self, aInFile, aOutFile, aContext=None):
+        """ Translate aInFile to aOutFile, which is written once. The per-file state is
+        kept in aContext, which is returned. Without aContext the state is created from 
+        the parser """
+        if not aContext:
+            aContext = TContext(str(), self.mDefines, self.mValues)
+            
+        aOutFile.write(''.join(self.translateBuffer(aInFile.read(), aContext)))
+        return aContext
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def translateFilter(self, aInFile, aOutFile, aContext):
+        """ Translate aInFile to aOutFile for a build pipeline. Nothing is written to 
+        the file system except the symbol table of mIds. A file, which could not be 
+        translated, is passed unchanged and mError is set in the returned context """
+        xBuffer = aInFile.read()
+        try:
+            xChunks = self.translateBuffer(xBuffer, aContext)
+        except Exception as xEx:
+            aContext.mError = '{}: line {}'.format(xEx, aContext.mLine)
+            xChunks = [xBuffer]
+        
+        aOutFile.writelines(xChunks)
+        aOutFile.flush()
+        self.appendSymbols(aContext)
+        return aContext
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def appendSymbols(self, aContext):
+        """ Append the symbols of a single translation to the symbol table and the 
+        records to the function index. Compiler processes run in parallel: Each appends 
+        its lines in a single write """
+        if self.mIds and aContext.mSymbols:
+            with open(os.path.join(self.mProjectRoot or '.', self.gSymbolFile), 'a') as xFile:
+                xFile.write(''.join('\t'.join(str(xItem) for xItem in xSymbol) + '\n' for xSymbol in aContext.mSymbols))
+        if self.mIndexFile and aContext.mIndex and not aContext.mError:
+            xIndex = TIndex(self.mIndexFile).open(aAppend=True)
+            try:
+                xIndex.write(aContext)
+            finally:
+                xIndex.close()
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def translateText(self, aText, aContext=None):
+        """ Translate aText in memory and return the instrumented text """
+        if not aContext:
+            aContext = TContext(str(), self.mDefines, self.mValues)
+            
+        return ''.join(self.translateBuffer(aText, aContext))
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def translateBuffer(self, aBuffer, aContext, aTokens=None):
+        """ Translate the content of a file and return the list of output chunks. Spans 
+        without injection are copied as one slice of aBuffer. aTokens are the matches 
+        of gTokenPattern in aBuffer, if the buffer is translated more than once. The 
+        caller counts these tokens """
+        xChunks         = ['#include "cti.h"\n']
+        xTokenList      = list()
+        xLastToken      = None
+        xSkipTo         = 0      # End of the argument list of an undefined macro
+        xCopyFrom       = 0      # Start of the span not yet copied to xChunks
+        xToken          = None
+        
+        xSkipNextToken  = False  # Skip token for method/function argument list
+        xColons         = 0      # Colons before the current identifier
+        xScoped         = False  # Identifier qualified by a class name
+        xScopeEnd       = 0      # Position of the scope operator
+        xListStart      = 0      # Start of the code of xTokenList after comments and directives
+        xClassEnd       = 0      # Position after the name of a class
+        xArgStart       = 0      # Position of the current argument
+        xName           = None   # Last identifier of xTokenList
+        xInitList       = False  # Member initializer list of a constructor
+        xIdent          = None   # Last identifier, it precedes a bracket starting at its end
+        xClassMacro     = False  # Attribute macro like __declspec(...) after class 
+        xBuffer         = aBuffer        
+        xStatement      = TBlock(TBlock.STATEMENT)  # Shared by all plain statement blocks
+        xIndex          = -1     # Index of the token for the stats
+        xBlocks         = 0
+        xFunctions      = 0
+        xSkipped        = 0
+        xStats          = aContext.mStats
+        xDirectiveTime  = xStats['time_directives']
+        xRules          = self.mRules
+        xBodyRules      = xRules is not None and xRules.hasBodyRules()
+        xIndexed        = bool(self.mIndexFile)
+        xLineNo         = 1      # Line at xLinePos, counted on demand for the index
+        xLinePos        = 0
+        xMaxCarry       = self.mLimits['carry']
+        xCheckAt        = self.gLimitCheck
+        xStart          = time.perf_counter()
+        aContext.mBlockList = list()
+        aContext.mProcess   = True
+        
+        xBlock          = TBlock(TBlock.DECLARATION, aContext.mClass)
+        aContext.mBlockList.append(xBlock)
                 
-                # Read next char and set xInxFind for block processing (xReadBlock != None)
-                xNextChar = xBuffer[xIndex]
-                xInxFind  = xIndex + 1
-
-                # Read macro
-                if xNextChar == '#':
-                    xReadBlock  = '\n'
+        try:
+            for xIndex, xToken in enumerate(aTokens if aTokens is not None else gTokenPattern.finditer(xBuffer)):
+                xKind     = xToken.lastgroup
+                
+                # Pathological input: Token list, block depth and time are checked periodically
+                if xIndex >= xCheckAt:
+                    xCheckAt += self.gLimitCheck
+                    self.checkLimits(aContext, xTokenList, xStart)
+                
+                # Skip the argument list of an undefined macro
+                if xSkipTo:
+                    if xToken.start() < xSkipTo:
+                        continue
+                    xSkipTo = 0
+                
+                # White space and operators without impact on the block structure
+                if xKind == 'TEXT':
+                    continue
+                if xKind == 'STRING' or xKind == 'RAW':
+                    if xToken.end() - xToken.start() > xMaxCarry:
+                        raise self.limitException('carry', xToken.end() - xToken.start())
                     continue
-                                
-                # Read comments as block. 
-                if xNextChar == '/':
-                    try:
-                        if xBuffer[xIndex+1] == '/':
-                            xReadBlock = '\n'
-                            xInxFind  += 1
-                            continue
-                        elif xBuffer[xIndex+1] == '*':
-                            xReadBlock = '*/'
-                            xInxFind  += 1
-                            continue
-                    except IndexError as xEx:
-                        xLastToken = '/'
-                        break                
                 
-                # Read strings as block
-                if xNextChar == '"':
-                    xReadBlock = '"'
+                # Read macros and comments as block
+                if xKind == 'COMMENT':
+                    if xToken.end() - xToken.start() > xMaxCarry:
+                        raise self.limitException('carry', xToken.end() - xToken.start())
+                    xComment   = xToken.group()
+                    xListStart = xToken.end()
+                    if xComment   == '/*CCQ_SHERLOK_SKIP_FCTN*/':
+                        aContext.mSkipNext = True                    
+                    elif xComment == '/*CCQ_SHERLOK_SKIP_FILE*/':
+                        aContext.mSkipAll  = True
                     continue
-
-                if xNextChar == "'":
-                    xReadBlock = "'"
+                
+                # Evaluate the macro blocks according to preprocessor statements. 
+                # This is necessary for counting the brackets correctly
+                if xKind == 'MACRO':
+                    if xToken.end() - xToken.start() > xMaxCarry:
+                        raise self.limitException('carry', xToken.end() - xToken.start())
+                    xListStart = xToken.end()
+                    self.translateDirective(aContext, xToken.group())
                     continue
-
+                
+                # Unterminated block: the rest of the file is copied
+                if xKind == 'OPEN':
+                    break
+                
                 # Check if this block needs to be processed
-                if not self.mBlockList[-1].doProcess():
-                    aOutFile.write(xNextChar)
-                    xIndex += 1
+                if not aContext.mProcess:
                     continue
 
-                # Read tokens. If the token is at the end of the buffer, store the value
-                # and read the next chunk
-                if xNextChar.isalnum() or xNextChar in ['~', '_']:
-                    try:                        
-                        xResult    = re.search('[~]?\w+', xBuffer[xIndex:])
-                        xLastToken = xResult.group(0)
-                        xInxFind   = xResult.span(0)[1] + xIndex
-                    except IndexError as xEx:
-                        break;
+                # Read tokens
+                if xKind == 'IDENT':
+                    xLastToken = xToken.group('IDENT')
                     
-                    if xLastToken not in self.mUndefines:
-                        aOutFile.write(xBuffer[xIndex:xInxFind])
-                    else:
-                        xMatch = re.search('\([\w ,]*\)', xBuffer[xIndex:])
+                    if xLastToken in self.mUndefines:
+                        xChunks.append(xBuffer[xCopyFrom:xToken.start()])
+                        xMatch = gUndefArgsPattern.match(xBuffer, xToken.end('IDENT'))
                         if xMatch:
-                            xIndex += xMatch.span(0)[1]
-                            xLastToken = None
+                            xSkipTo   = xMatch.end()
+                            xCopyFrom = xSkipTo
                         else:
-                            xIndex = xInxFind
+                            xCopyFrom = xToken.start() + len(xLastToken)
+                        xLastToken = None
                         continue    
-                        
-                    if 'class' in xTokenList:
-                        xBlock = self.mBlockList[-1]
-                        xBlock.mNested  = TBlock(TBlock.CLASS, xLastToken)
-                        xTokenList = list()
+                    
+                    # Operators are named by their symbol, which has no impact on the block structure
+                    if xLastToken == 'operator':
+                        xMatch = gOperatorPattern.match(xBuffer, xToken.end('IDENT'))
+                        if xMatch:
+                            if xMatch.group('SYMBOL'):
+                                xLastToken = 'operator' + ''.join(xMatch.group('SYMBOL').split())
+                            else:
+                                xLastToken = 'operator ' + xMatch.group('WORD')
+                            xSkipTo = xMatch.end()
+                    
+                    if xTokenList and xTokenList[-1] in gClassKeys:
+                        # No class within an argument list, like f(struct stat *s)
+                        xBlock = aContext.mBlockList[-1]
+                        if xBlock.mNested is None or xBlock.mNested.mArguments is None:
+                            xBlock.mNested = TBlock(TBlock.CLASS, xLastToken)
+                            xTokenList  = list()
+                            xClassMacro = False
+                            xClassEnd   = xToken.end('IDENT')
+                    elif xClassMacro:
+                        # The class name follows the attribute macro
+                        xNested = aContext.mBlockList[-1].mNested
+                        if xNested and xNested.mBlockType == TBlock.CLASS:
+                            xNested.mName = xNested.mClassName = xLastToken
                     
                     if xSkipNextToken:
                         xSkipNextToken = False
                     else:    
+                        if not xTokenList:
+                            xListStart = xToken.start()
                         xTokenList.append(xLastToken)
-                    xIndex     = xInxFind
+                        xScoped = xColons == 2
+                        xName   = xToken
+                    xColons    = 0
                     xLastToken = None
+                    xIdent     = xToken
                     continue
                 
-                if xNextChar == '{':
-                    xBlock = self.mBlockList[-1]
-                                                                
-                    if xBlock.mNested:
-                        # print('block {} {} {}'.format( TBlock.gEnumNames[xBlock.mNested.mBlockType], xBlock.mNested.mName, xBlock.mNested.mListArgs))                            
-                        self.mBlockList.append(xBlock.mNested)
+                xChar   = xBuffer[xToken.start()]
+                xInject = None
+                if xChar == '{':
+                    xBlock  = aContext.mBlockList[-1]
+                    xNested = xBlock.mNested
+                    
+                    # Namespace and linkage blocks keep the declaration scope, a namespace
+                    # could follow a macro call without semicolon
+                    xNames = None
+                    if xTokenList and xBlock.mBlockEnv.mBlockType == TBlock.DECLARATION:
+                        if 'namespace' in xTokenList:
+                            xNames = xTokenList[len(xTokenList) - xTokenList[::-1].index('namespace'):]
+                        elif xTokenList[-1] == 'extern' and not xNested:
+                            xNames = list()
+                    
+                    if xNested and (xNested.mArguments is not None or (xInitList and xIdent.end() == xToken.start())):
+                        # Brace initializer or lambda within an argument list or a member 
+                        # initializer: The argument list continues after the block
+                        xNewBlock = TBlock(TBlock.INITIALIZER)
+                        xNewBlock.mListArgs = xTokenList
+                        aContext.mBlockList.append(xNewBlock)
+                        xTokenList = list()
+                    elif xNames is not None:
+                        xNewBlock = TBlock(TBlock.DECLARATION, xBlock.mBlockEnv.mName)
+                        xNewBlock.mPackage = aContext.mPackage
+                        if xNames:
+                            aContext.mPackage = '.'.join(([aContext.mPackage] if aContext.mPackage else []) + xNames)
+                        aContext.mBlockList.append(xNewBlock)
+                        xBlock.mNested = None
+                        xTokenList     = list()
+                    elif xNested:
+                        xNewBlock = xBlock.mNested
+                        # print('block {} {} {}'.format( xBlock.mNested.mBlockType.name, xBlock.mNested.mName, xBlock.mNested.mListArgs))                            
+                        aContext.mBlockList.append(xBlock.mNested)
                         
                         if xBlock.mNested.mBlockType in [TBlock.METHOD, TBlock.FUNCTION]:                            
                             xMethodName = xBlock.mNested.mName
                             xClassName  = xBlock.mNested.mClassName
                             xSignature  = str()
                             xArgsList   = str()
+                            xId         = None
                                                         
                             if xBlock.mNested.mListArgs:
                                 xSignature  = ','.join(xBlock.mNested.mListArgs)
                                 xArgsList   = [x.split(':')[0] for x in xBlock.mNested.mListArgs]
 
-                            if self.mSkipNext or self.mSkipAll:
+                            if aContext.mSkipNext or aContext.mSkipAll or (xRules and xMethodName != 'mainU' and 
+                                    not xRules.isIncluded(aContext.mPackage, xClassName, xMethodName)):
                                 xBlock.mNested.mBlockType = TBlock.STATEMENT
-                                self.mSkipNext = False
+                                aContext.mSkipNext = False
+                                xSkipped += 1
                             elif xMethodName == 'mainU':
                                 xArgsList[0] = '&' + xArgsList[0] 
-                                aOutFile.write('CCQ_SHERLOK_BEGIN( cR("{}"), cR("{}"), {}, {} )'.format(self.mPackage, xClassName, *xArgsList))
-                                xNextChar = ''
+                                xInject = 'CCQ_SHERLOK_BEGIN( cR("{}"), cR("{}"), {}, {} )'.format(aContext.mPackage, xClassName, *xArgsList)
+                            elif self.mIds:
+                                xId   = self.functionId(aContext.mPackage, xClassName, xMethodName, xSignature)
+                                xRate = xRules.sampleRate(aContext.mPackage, xClassName, xMethodName) if xRules else 1
+                                aContext.mSymbols.append((xId, aContext.mPackage, xClassName, xMethodName, xSignature, xRate))
+                                if len(xArgsList) > 0:
+                                    xInject = 'CCQ_SHERLOK_FCT_BEGIN_ID( {}, {} )'.format(xId, ','.join(xArgsList))
+                                else:
+                                    xInject = 'CCQ_SHERLOK_FCT_BEGIN_ID( {} )'.format(xId)
                             else:
                                 if len(xArgsList) > 0:
-                                    aOutFile.write('CCQ_SHERLOK_FCT_BEGIN( cR("{}"), cR("{}"), cR("{}"), cR("{}"), {} )'.format(self.mPackage, xClassName, xMethodName, xSignature, ','.join(xArgsList)))
+                                    xInject = 'CCQ_SHERLOK_FCT_BEGIN( cR("{}"), cR("{}"), cR("{}"), cR("{}"), {} )'.format(aContext.mPackage, xClassName, xMethodName, xSignature, ','.join(xArgsList))
                                 else:
-                                    aOutFile.write('CCQ_SHERLOK_FCT_BEGIN( cR("{}"), cR("{}"), cR("{}"), cR("{}") )'.format(self.mPackage, xClassName, xMethodName, xSignature))
-                                    
-                                xNextChar = ''
+                                    xInject = 'CCQ_SHERLOK_FCT_BEGIN( cR("{}"), cR("{}"), cR("{}"), cR("{}") )'.format(aContext.mPackage, xClassName, xMethodName, xSignature)
+                            if xInject:
+                                xFunctions += 1
+                                if xIndexed:
+                                    xLineNo  += xBuffer.count('\n', xLinePos, xToken.start())
+                                    xLinePos  = xToken.start()
+                                    aContext.mIndex.append((xLineNo, aContext.mPackage, xClassName, xMethodName, xSignature, xId))
+                                if xBodyRules and xMethodName != 'mainU':
+                                    xNewBlock.mInject = (len(xChunks) + 1, xToken.start(), len(aContext.mSymbols), len(aContext.mIndex))
                         xBlock.mNested = None
+                        xInitList      = False
+                        xClassMacro    = False
                     else:
-                        self.mBlockList.append( TBlock(TBlock.STATEMENT) )
+                        aContext.mBlockList.append( xStatement )
+                    xBlocks += 1
                         
                         
-                elif xNextChar == '}':
-                    xBlock = self.mBlockList.pop()
-                    if xBlock.mBlockType in [TBlock.METHOD, TBlock.FUNCTION]:
-                        xNextChar = ''
-                    
+                elif xChar == '}':
+                    # Macro blocks opened within the block are kept for #else and #endif
+                    xPos = len(aContext.mBlockList) - 1
+                    while aContext.mBlockList[xPos].mBlockType == TBlock.MACRO:
+                        xPos -= 1
+                    # Unbalanced source: The file scope is never closed
+                    if xPos == 0:
+                        raise TLimitException('unbalanced closing bracket')
+                    xBlock = aContext.mBlockList.pop(xPos)
+                    for xMacro in aContext.mBlockList[xPos:]:
+                        xMacro.mBlockEnv = aContext.mBlockList[xPos - 1].mBlockEnv
+                    # The shared statement block is clean for the enclosing block
+                    if xBlock is xStatement:
+                        xStatement.mNested = None
+                    elif xBlock.mBlockType == TBlock.INITIALIZER:
+                        xTokenList = xBlock.mListArgs
+                    elif xBlock.mPackage is not None:
+                        aContext.mPackage = xBlock.mPackage
+                    elif xBlock.mBlockType in [TBlock.METHOD, TBlock.FUNCTION]:
                         if xBlock.mName == 'mainU':  
-                            aOutFile.write('CCQ_SHERLOK_END\n')
-                            aOutFile.write('#include "cti.cpp"')                            
+                            xInject = 'CCQ_SHERLOK_END\n#include "cti.cpp"'
+                        elif xBlock.mInject and xRules.isSmall(xBuffer, xBlock.mInject[1], xToken.start()):
+                            # Small body: Restore the bracket of the function begin
+                            xChunks[xBlock.mInject[0]] = '{'
+                            if self.mIds:
+                                del aContext.mSymbols[xBlock.mInject[2] - 1]
+                            if xIndexed:
+                                del aContext.mIndex[xBlock.mInject[3] - 1]
+                            xFunctions -= 1
+                            xSkipped   += 1
                         else:
-                            aOutFile.write('CCQ_SHERLOK_FCT_END')
+                            xInject = 'CCQ_SHERLOK_FCT_END'
 
-                elif xNextChar == '=':
-                    xBlock = self.mBlockList[-1]
+                elif xChar == '=':
+                    xBlock = aContext.mBlockList[-1]
                     if xBlock.mNested:
                         if xBlock.mNested.mArguments != None:
                             xSkipNextToken = True
+                        elif (xBlock.mNested.mBlockType != TBlock.STATEMENT and not xInitList and 
+                                xBuffer[xToken.start() - 1] not in '=!<>' and xBuffer[xToken.start() + 1:xToken.start() + 2] != '='):
+                            # Assignment after a declaration: = 0, = default or = lambda
+                            xBlock.mNested = xStatement
                     else:
-                        xBlock.mNested = TBlock(TBlock.STATEMENT)
+                        xBlock.mNested = xStatement
                         
-                elif xNextChar in ['*']:
-                    xBlock = self.mBlockList[-1]
-                    if xBlock.mNested and xBlock.mNested.mArguments != None:
-                        xQualifier += xNextChar
-
-                elif xNextChar in [':']:
-                    xQualifier += ':'
+                elif xChar in [':']:
+                    xColons    += 1
+                    xClassMacro = False
+                    if xColons == 1:
+                        xScopeEnd = xToken.start()
+                    xNested     = aContext.mBlockList[-1].mNested
+                    if (xNested and xNested.mBlockType in [TBlock.METHOD, TBlock.FUNCTION] and xNested.mArguments is None 
+                            and xColons == 1 and xBuffer[xToken.start() + 1:xToken.start() + 2] != ':'):
+                        xInitList = True
                     
-                elif xNextChar == '[':
-                    xBlock = self.mBlockList[-1]
+                elif xChar == '[':
+                    xBlock = aContext.mBlockList[-1]
                     if xBlock.mNested and xBlock.mNested.mArguments != None:
-                        xQualifier += '*'
+                        if xIdent and xIdent.end() == xToken.start():
+                            # Array argument: The dimension is not an argument name
+                            xSkipTo     = xBuffer.find(']', xToken.start()) + 1
+                        else:
+                            # Lambda within the arguments: This is a call, not a declaration
+                            xBlock.mNested = xStatement
 
-                elif xNextChar == ';':
-                    self.mBlockList[-1].mNested = None
+                elif xChar == ';':
+                    aContext.mBlockList[-1].mNested = None
+                    xTokenList  = list()
+                    xInitList   = False
+                    xClassMacro = False
                 
                 # This could be a function or method declaration
                 # Create a nested temporary block and wait for "};" to create or discard
-                elif xNextChar == '(':
-                    xBlock = self.mBlockList[-1]
+                elif xChar == '(':
+                    xBlock  = aContext.mBlockList[-1]
+                    xNested = xBlock.mNested
+                    
+                    if xNested and xNested.mBlockType == TBlock.CLASS:
+                        xPrefix = xBuffer[xClassEnd:xToken.start()]
+                        if xPrefix.count('<') > xPrefix.count('>'):
+                            # Specialization like struct X<R (*)()>
+                            pass
+                        elif len(xTokenList) > 1:
+                            # Template parameter or elaborated return type like struct stat *f()
+                            xBlock.mNested = None
+                        else:
+                            xClassMacro = True
+                    
+                    if (xBlock.mNested == None and xTokenList and xBlock.mBlockEnv.mBlockType in (TBlock.DECLARATION, TBlock.CLASS) 
+                            and not xTokenList[-1].startswith('operator')):
+                        # Function type within template arguments like std::function<void(int)> f()
+                        if xBuffer.count('<', xListStart, xToken.start()) > xBuffer.count('>', xListStart, xToken.start()):
+                            continue
+                        # Explicit template arguments like f<int>(): The name precedes the arguments
+                        xNameStart, xNameEnd = self.templateSpan(xBuffer, xToken.start())
+                        xTemplate = xBuffer[xNameStart:xNameEnd]
+                        if xTemplate in xTokenList:
+                            del xTokenList[len(xTokenList) - xTokenList[::-1].index(xTemplate):]
+                            while xNameStart > 0 and xBuffer[xNameStart - 1].isspace():
+                                xNameStart -= 1
+                            xScoped = xBuffer[xNameStart - 2:xNameStart] == '::'
                     
                     if xBlock.mNested == None:
-                        if xBlock.mBlockEnv.mBlockType == TBlock.DECLARATION:
-                            if xQualifier == '::':
+                        if not xTokenList or xTokenList[-1] in gStatementKeys:
+                            xBlock.mNested = xStatement
+                        elif xBlock.mBlockEnv.mBlockType == TBlock.DECLARATION:
+                            if xScoped and len(xTokenList) > 1:
                                 xBlock.mNested = TBlock(TBlock.METHOD, xTokenList[-1])
-                                xBlock.mNested.mClassName = xTokenList[-2]
+                                xBlock.mNested.mClassName = self.templateName(xBuffer, xScopeEnd) or xTokenList[-2]
                             else:
                                 xBlock.mNested = TBlock(TBlock.FUNCTION, xTokenList[-1])
                                 xBlock.mNested.mClassName = xBlock.mBlockEnv.mName
@@ -478,34 +1786,927 @@ class TParser:
                             xBlock.mNested.mClassName = xBlock.mBlockEnv.mName
                             xBlock.mNested.mArguments = list()
                         else:
-                            xBlock.mNested = TBlock(TBlock.STATEMENT)
+                            xBlock.mNested = xStatement
                     xTokenList = list()
-                    xQualifier = str()
+                    xColons    = 0
+                    xArgStart  = xToken.end()
                     
                 # This could be an argument-list of a method/function
                 # In this case mNested and mNested.mArguments are defined
-                elif xNextChar in [')', ',']:
+                elif xChar in [')', ',']:
                     xSkipNextToken = False
-                    xBlock         = self.mBlockList[-1]
+                    xBlock         = aContext.mBlockList[-1]
                     
                     if xBlock.mNested:
                         if xBlock.mNested.mBlockType in [TBlock.METHOD, TBlock.FUNCTION]:
-                            if len(xTokenList) > 1 and xBlock.mNested.mArguments != None:
-                                xBlock.mNested.mArguments.append( '{}:{}'.format(xTokenList[-1], xTokenList[-2]+xQualifier) )
-                        else:
+                            if xBlock.mNested.mArguments != None:
+                                xArgument = xBuffer[xArgStart:xToken.start()]
+                                if xChar == ',' and xArgument.count('<') > xArgument.count('>'):
+                                    # Comma of template arguments like std::map<K, V> aMap
+                                    continue
+                                # Without argument name the last identifier is a qualified name, a keyword or 
+                                # followed by a declarator like const T&. A parameter pack is not passed
+                                xDeclarator = xBuffer[xName.end('IDENT'):xToken.start()]
+                                if '/' in xDeclarator or '=' in xDeclarator:
+                                    xDeclarator = gDirectiveNoise.sub('', xDeclarator).partition('=')[0]
+                                if (len(xTokenList) > 1 and not xScoped and '...' not in xArgument and xTokenList[-1] not in gTypeKeys 
+                                        and '&' not in xDeclarator and '*' not in xDeclarator and '>' not in xDeclarator 
+                                        and not (len(xTokenList) == 2 and xTokenList[0] in gQualifierKeys)):
+                                    # Arrays are passed as pointer
+                                    xType = self.typeName(xBuffer, xArgStart, xName.start('IDENT')) + '*' * xDeclarator.count('[')
+                                    xBlock.mNested.mArguments.append( '{}:{}'.format(xTokenList[-1], xType) )
+                                xArgStart = xToken.end()
+                        elif xBlock.mNested.mBlockType != TBlock.CLASS:
                             xBlock.mNested = None
                             
-                        if xNextChar == ')':
+                        if xChar == ')':
                             if xBlock.mNested != None and xBlock.mNested.mArguments != None:
                                 xBlock.mNested.mListArgs  = xBlock.mNested.mArguments
                                 xBlock.mNested.mArguments = None
 
-                        xQualifier = str()
                         xTokenList = list()
+                
+                # Replace the bracket by the injected statement
+                if xInject:
+                    xChunks.append(xBuffer[xCopyFrom:xToken.start()])
+                    if xBuffer[xToken.start() - 1:xToken.start()].isalnum():
+                        xInject = ' ' + xInject
+                    xChunks.append(xInject)
+                    xCopyFrom = xToken.start() + 1
                     
-                aOutFile.write(xNextChar)
-                xIndex += 1        
+        except Exception:
+            # Line of the failing token for the error report
+            aContext.mLine = xBuffer.count('\n', 0, xToken.start() if xToken else 0) + 1
+            raise
+        
+        aContext.mLine = xBuffer.count('\n')
+        xChunks.append(xBuffer[xCopyFrom:])
+        
+        # Tokens of a shared token list are counted once by the caller
+        if aTokens is None:
+            xStats['tokens']    += xIndex + 1
+        xStats['blocks']        += xBlocks
+        xStats['functions']     += xFunctions
+        xStats['skipped']       += xSkipped
+        xStats['time_tokenize'] += time.perf_counter() - xStart - (xStats['time_directives'] - xDirectiveTime)
+        return xChunks
                                    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    @staticmethod
+    def typeName(aBuffer, aStart, aEnd):
+        """ Return the type of an argument starting at aStart, its name starts at aEnd. 
+        The type is the last name with scope and template arguments and the pointers. 
+        Qualifiers and references are dropped
+        
+        >>> xArg = 'const std::map<int, T> &aMap'
+        >>> TParser.typeName(xArg, 0, xArg.index('aMap'))
+        'std::map<int, T>'
+        >>> [TParser.typeName(x, 0, x.rindex(' ') + 1) for x in ['char ** argv', 'const ::std::string& s', 'unsigned int n', 'T const* const p']]
+        ['char**', '::std::string', 'int', 'T*']
+        """
+        xEnd = aEnd
+        while True:
+            while xEnd > aStart and aBuffer[xEnd - 1] in ' \t\r\n*&':
+                xEnd -= 1
+            # Qualifiers after the type like T const &
+            xWord = xEnd
+            while xWord > aStart and (aBuffer[xWord - 1].isalnum() or aBuffer[xWord - 1] == '_'):
+                xWord -= 1
+            if xWord == xEnd or aBuffer[xWord:xEnd] not in ('const', 'volatile'):
+                break
+            xEnd = xWord
+        xPos   = xEnd
+        xScope = None   # Position of the last scope operator
+        
+        while True:
+            if xPos > aStart and aBuffer[xPos - 1] == '>':
+                xDepth = 0
+                while xPos > aStart:
+                    xPos -= 1
+                    if aBuffer[xPos] == '>':
+                        xDepth += 1
+                    elif aBuffer[xPos] == '<':
+                        xDepth -= 1
+                        if xDepth == 0:
+                            break
+                while xPos > aStart and aBuffer[xPos - 1].isspace():
+                    xPos -= 1
+            
+            xName = xPos
+            while xPos > aStart and (aBuffer[xPos - 1].isalnum() or aBuffer[xPos - 1] == '_'):
+                xPos -= 1
+            if xScope is not None and (xPos == xName or aBuffer[xPos:xName] in gQualifierKeys):
+                # Global scope like const ::std::string
+                xPos = xScope
+                break
+            
+            # Scope operator before the name
+            xName = xPos
+            while xName > aStart and aBuffer[xName - 1].isspace():
+                xName -= 1
+            if xName - 2 < aStart or aBuffer[xName - 2:xName] != '::':
+                break
+            xPos = xScope = xName - 2
+            while xPos > aStart and aBuffer[xPos - 1].isspace():
+                xPos -= 1
+            
+        return ' '.join(aBuffer[xPos:xEnd].split()) + '*' * aBuffer.count('*', xEnd, aEnd)
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    @staticmethod
+    def templateName(aBuffer, aEnd):
+        """ Return the name of a template class A<T> ending before aEnd or None 
+        
+        >>> TParser.templateName('A<B<T>, 2> :: f', 11)
+        'A'
+        >>> TParser.templateName('TMap_2 <K, V>::get', 13)
+        'TMap_2'
+        """
+        xStart, xEnd = TParser.templateSpan(aBuffer, aEnd)
+        return aBuffer[xStart:xEnd] or None
+        
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    @staticmethod
+    def templateSpan(aBuffer, aEnd):
+        """ Return start and end of the name of a template A<T> ending before aEnd. 
+        Both are aEnd, if there is no template """
+        xPos = aEnd - 1
+        while xPos >= 0 and aBuffer[xPos].isspace():
+            xPos -= 1
+        if xPos < 0 or aBuffer[xPos] != '>':
+            return aEnd, aEnd
+        
+        xDepth = 0
+        for xPos in range(xPos, max(xPos - 1024, -1), -1):
+            if aBuffer[xPos] == '>':
+                xDepth += 1
+            elif aBuffer[xPos] == '<':
+                xDepth -= 1
+                if xDepth == 0:
+                    break
+        else:
+            return aEnd, aEnd
+        
+        # The identifier before the bracket, scanned back in place
+        xEnd = xPos
+        while xEnd > 0 and aBuffer[xEnd - 1].isspace():
+            xEnd -= 1
+        xStart = xEnd
+        while xStart > 0 and (aBuffer[xStart - 1].isalnum() or aBuffer[xStart - 1] == '_'):
+            xStart -= 1
+        return (xStart, xEnd) if xStart < xEnd else (aEnd, aEnd)
+        
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def translateDirective(self, aContext, aMacroStmt):
+        """ Evaluate the macro blocks according to preprocessor statements. 
+        Macro blocks are nested independent from program logic """
+        xStart   = time.perf_counter()
+        xMatch   = gDirectivePattern.match(aMacroStmt)
+        xHandler = self.gDirectives.get(xMatch.group(1))
+        if xHandler:
+            xHandler(self, aContext, gDirectiveNoise.sub(' ', xMatch.group(2)).strip())
+            
+        aContext.mStats['directives']      += 1
+        aContext.mStats['time_directives'] += time.perf_counter() - xStart
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def openMacroBlock(self, aContext, aName, aCondition):
+        """ Push a macro block, which inherits the environment of the enclosing 
+        program block. aCondition is only evaluated, if the enclosing block is processed """
+        for xBlockEnv in reversed(aContext.mBlockList):
+            if xBlockEnv.mBlockType != TBlock.MACRO:
+                break
+        
+        xBlock = TBlock(TBlock.MACRO, aName, xBlockEnv)
+        xBlock.mEnvProcess = aContext.mProcess
+        xBlock.conditionalBlock(aContext.mProcess and aCondition())
+        aContext.mBlockList.append(xBlock)
+        aContext.mStats['blocks'] += 1
+        aContext.mProcess = xBlock.doProcess()
+        
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def findMacroBlock(self, aContext):
+        """ Return the index of the innermost macro block or None """
+        for xIndex in range(len(aContext.mBlockList) - 1, -1, -1):
+            if aContext.mBlockList[xIndex].mBlockType == TBlock.MACRO:
+                return xIndex
+        return None
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def evaluateCondition(self, aContext, aExpression):
+        """ Return the truth value of an #if condition. Conditions, which could not
+        be evaluated like invalid character escapes, are false """
+        try:
+            return bool(TExpression(aContext.mDefines, aContext.mValues).evaluate(aExpression))
+        except (TranslateException, ArithmeticError, ValueError, RecursionError):
+            return False
+        
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def directiveIf(self, aContext, aArgs):
+        self.openMacroBlock(aContext, str(), lambda: self.evaluateCondition(aContext, aArgs))
+        
+    def directiveIfdef(self, aContext, aArgs):
+        xName = aArgs.split(' ')[0]
+        self.openMacroBlock(aContext, xName, lambda: xName in aContext.mDefines)
+        
+    def directiveIfndef(self, aContext, aArgs):
+        xName = aArgs.split(' ')[0]
+        self.openMacroBlock(aContext, xName, lambda: xName not in aContext.mDefines)
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def directiveElif(self, aContext, aArgs):
+        """ The branch is taken, if no previous branch was taken """
+        xIndex = self.findMacroBlock(aContext)
+        if xIndex is not None:
+            xBlock = aContext.mBlockList[xIndex]
+            xBlock.conditionalBlock(xBlock.mEnvProcess and not xBlock.mDone and 
+                                    self.evaluateCondition(aContext, aArgs))
+            aContext.mProcess = xBlock.doProcess()
+            
+    def directiveElse(self, aContext, aArgs):
+        xIndex = self.findMacroBlock(aContext)
+        if xIndex is not None:
+            xBlock = aContext.mBlockList[xIndex]
+            xBlock.conditionalBlock(xBlock.mEnvProcess)
+            aContext.mProcess = xBlock.doProcess()
+        
+    def directiveEndif(self, aContext, aArgs):
+        xIndex = self.findMacroBlock(aContext)
+        if xIndex is not None:
+            aContext.mProcess = aContext.mBlockList.pop(xIndex).mEnvProcess
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def directiveDefine(self, aContext, aArgs):
+        """ Add the name to the defines. Integer values are kept for conditions """
+        xMatch = gMacroNamePattern.match(aArgs)
+        if xMatch and aContext.mProcess:
+            aContext.mDefines.add(xMatch.group(1))
+            xValue = TExpression.toNumber(xMatch.group(2))
+            if xValue is None:
+                aContext.mValues.pop(xMatch.group(1), None)
+            else:
+                aContext.mValues[xMatch.group(1)] = xValue
+            
+    def directiveUndef(self, aContext, aArgs):
+        xMatch = gMacroNamePattern.match(aArgs)
+        if xMatch and aContext.mProcess:
+            aContext.mDefines.discard(xMatch.group(1))
+            aContext.mValues.pop(xMatch.group(1), None)
+            
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def directiveInclude(self, aContext, aArgs):
+        """ Apply the define effects of a header found with mIncludePath. Headers not 
+        found like system headers and includes by macro name have no effect """
+        if not self.mIncludePath or not aContext.mProcess or aContext.mDepth >= self.gIncludeDepth:
+            return
+        xMatch = gIncludePattern.match(aArgs)
+        if not xMatch:
+            return
+        
+        if xMatch.group(1):
+            xFqFileName = self.findHeader(xMatch.group(1), os.path.dirname(aContext.mFqFileName))
+        else:
+            xFqFileName = self.findHeader(xMatch.group(2))
+        if not xFqFileName:
+            return
+        
+        try:
+            xDefined, xRemoved, xHeaders = self.headerEffects(xFqFileName, aContext)
+        except OSError:
+            return
+        aContext.mHeaders.update(xHeaders)
+        for xName in xRemoved:
+            aContext.mDefines.discard(xName)
+            aContext.mValues.pop(xName, None)
+        for xName, xValue in xDefined.items():
+            aContext.mDefines.add(xName)
+            if xValue is None:
+                aContext.mValues.pop(xName, None)
+            else:
+                aContext.mValues[xName] = xValue
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def findHeader(self, aName, aDir=None):
+        """ Return the absolute path of the header aName in aDir or mIncludePath or 
+        None. A header translated in place is found by its .orig copy. Found headers 
+        are kept for the process, a header created later is still found """
+        xKey = (aName, aDir, tuple(self.mIncludePath))
+        xFqFileName = self.gIncludeFiles.get(xKey)
+        if xFqFileName is None:
+            for xDir in ([aDir or '.'] if aDir is not None else []) + self.mIncludePath:
+                xPath = os.path.join(xDir, aName)
+                if os.path.isfile(xPath) or os.path.isfile(xPath + '.orig'):
+                    xFqFileName = self.gIncludeFiles[xKey] = os.path.abspath(xPath)
+                    break
+        return xFqFileName
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    @staticmethod
+    def statHeader(aFqFileName):
+        """ Return the path to read and the size and modification time of a header. 
+        The .orig copy of a header translated in place is the original. It is checked 
+        again after the header, as a translation in another process renames the 
+        header to the copy. Raises OSError for a missing header """
+        for xFqFileName in (aFqFileName + '.orig', aFqFileName, aFqFileName + '.orig'):
+            try:
+                xStat = os.stat(xFqFileName)
+            except FileNotFoundError:
+                continue
+            return xFqFileName, [xStat.st_size, xStat.st_mtime_ns]
+        raise FileNotFoundError('header not found: {}'.format(aFqFileName))
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def headerEffects(self, aFqFileName, aContext):
+        """ Return the defines set by the header as dict of name and value, the 
+        set of names removed and the stats of the header and its nested headers, see 
+        statHeader. The directives of the header are evaluated, nested includes are 
+        applied recursively. The result is kept for the process by path, stats and 
+        the incoming defines. A header enclosed in an include guard has no effect, 
+        once the guard is defined """
+        xPath, xStat = self.statHeader(aFqFileName)
+        xFile = (xPath,) + tuple(xStat)
+        if xFile not in self.gHeaderFiles:
+            self.gHeaderFiles[xFile] = self.readDirectives(xPath)
+        xDirectives, xGuard = self.gHeaderFiles[xFile]
+        if xGuard in aContext.mDefines:
+            return dict(), frozenset(), {aFqFileName: xStat}
+        
+        xKey = xFile + (frozenset(aContext.mDefines), frozenset(aContext.mValues.items()))
+        xEffects = self.gHeaderCache.get(xKey)
+        if xEffects is not None:
+            return xEffects
+        
+        xHeader = TContext(aFqFileName, aContext.mDefines, aContext.mValues)
+        xHeader.mDepth     = aContext.mDepth + 1
+        xHeader.mBlockList = [TBlock(TBlock.DECLARATION)]
+        for xDirective in xDirectives:
+            self.translateDirective(xHeader, xDirective)
+        
+        xDefined = { xName: xHeader.mValues.get(xName) for xName in xHeader.mDefines 
+                     if xName not in aContext.mDefines or xHeader.mValues.get(xName) != aContext.mValues.get(xName) }
+        xHeader.mHeaders[aFqFileName] = xStat
+        xEffects = (xDefined, aContext.mDefines - xHeader.mDefines, xHeader.mHeaders)
+        self.gHeaderCache[xKey] = xEffects
+        return xEffects
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def readDirectives(self, aFqFileName):
+        """ Read the preprocessor statements of a header and its include guard. The 
+        guard is the name of an #ifndef, if its block encloses all code and all other
+        statements of the header, else the guard is None """
+        try:
+            xBuffer = self.readSource(aFqFileName)
+        except ValueError:
+            # Not decodable: The header has no effect
+            return (), None
+        
+        xDirectives = list()
+        xDepth      = 0
+        xClosed     = list()   # Index of the statements closing a top level block
+        xOutside    = False    # Code outside of conditional blocks
+        for xToken in gTokenPattern.finditer(xBuffer):
+            xKind = xToken.lastgroup
+            if xKind == 'MACRO':
+                xDirectives.append(xToken.group())
+                xWord = gDirectivePattern.match(xDirectives[-1]).group(1)
+                if xWord in ('if', 'ifdef', 'ifndef'):
+                    xDepth += 1
+                elif xWord == 'endif' and xDepth:
+                    xDepth -= 1
+                    if not xDepth:
+                        xClosed.append(len(xDirectives) - 1)
+            elif not xDepth and xKind != 'COMMENT' and not (xKind == 'TEXT' and xToken.group().isspace()):
+                xOutside = True
+        
+        xMatch = gGuardPattern.match(xDirectives[0]) if xDirectives else None
+        if xMatch and not xOutside and xClosed == [len(xDirectives) - 1]:
+            return tuple(xDirectives), xMatch.group(1)
+        return tuple(xDirectives), None
+            
+    gDirectives = { 'if'    : directiveIf,
+                    'ifdef' : directiveIfdef,
+                    'ifndef': directiveIfndef,
+                    'elif'  : directiveElif,
+                    'else'  : directiveElse,
+                    'endif' : directiveEndif,
+                    'define': directiveDefine,
+                    'undef' : directiveUndef,
+                    'include': directiveInclude }
+    
+# ------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------
+class TRequestHandler(socketserver.StreamRequestHandler):
+    """ Handles the requests of one connection. A request is a JSON header line, 
+    followed by length bytes of UTF-8 source. The response has the same format """
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def handle(self):
+        """ Answer requests until the client closes the connection """
+        while True:
+            xLine = self.rfile.readline()
+            if not xLine:
+                return
+            try:
+                xHeader = json.loads(xLine.decode('utf-8'))
+                xBody   = None
+                if 'length' in xHeader:
+                    xBody = self.rfile.read(xHeader['length']).decode('utf-8', 'surrogateescape')
+                xResult, xOutput = self.server.mServer.translate(xHeader, xBody)
+            except Exception as xEx:
+                xResult, xOutput = {'error': repr(xEx)}, None
+            
+            xData = xOutput.encode('utf-8', 'surrogateescape') if xOutput is not None else b''
+            xResult['length'] = len(xData)
+            self.wfile.write(json.dumps(xResult).encode('utf-8') + b'\n' + xData)
+            self.wfile.flush()
+            
+# ------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------
+class TServer:
+    """ TServer keeps one parser with its settings for many translations. It listens 
+    on a Unix socket, so only local users with write access to the socket could send 
+    requests. Requests are handled in forked processes, where fork is available, 
+    otherwise in threads. With TParser.mIncludePath the requests are handled in 
+    threads, so the header caches of the parser are shared by all requests. 
+    cppclient.py sends the requests of a build. The header of a request has the 
+    optional keys: 
+        file     the source file, read by the server without length
+        out      the output file written by the server, the response has no source
+        package  the package, default derived from file
+        class    the class of free functions, default derived from file 
+        length   the length of the source following the header
+    The response header has the keys error, functions, length and source. source is
+    true, if the response carries the source or the source was written to out, either
+    translated or passed unchanged """
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def __init__(self, aParser, aAddress):
+        """ aParser is configured by the command line """
+        self.mParser  = aParser
+        self.mAddress = aAddress
+        
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def serve(self):
+        """ Serve until interrupted. The socket is removed at the end """
+        if not hasattr(socket, 'AF_UNIX'):
+            raise TranslateException('serve needs Unix sockets')
+        xAddress = self.mAddress
+        xMixIn   = socketserver.ThreadingMixIn
+        if hasattr(os, 'fork') and not self.mParser.mIncludePath:
+            xMixIn = socketserver.ForkingMixIn
+        if os.path.exists(xAddress):
+            os.remove(xAddress)
+        
+        xServerClass = type('TSocketServer', (xMixIn, socketserver.UnixStreamServer), {'daemon_threads': True})
+        with xServerClass(xAddress, TRequestHandler) as xServer:
+            xServer.mServer = self
+            signal.signal(signal.SIGTERM, lambda aSignal, aFrame: sys.exit(0))
+            print('serve {}'.format(self.mAddress))
+            sys.stdout.flush()
+            try:
+                xServer.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                if os.path.exists(xAddress):
+                    os.remove(xAddress)
+        
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def translate(self, aHeader, aBody):
+        """ Translate one request and return the response header and the output. A 
+        source, which could not be translated, is returned unchanged with error set """
+        xParser     = self.mParser
+        xFqFileName = aHeader.get('file', '-')
+        if aBody is None:
+            aBody = xParser.readSource(xFqFileName)
+        
+        xContext = xParser.newContext(xFqFileName, xParser.mDefines, xParser.mValues)
+        xContext.mPackage = aHeader.get('package', xContext.mPackage if 'file' in aHeader else str())
+        xContext.mClass   = aHeader.get('class',   xContext.mClass   if 'file' in aHeader else str())
+        try:
+            xOutput = ''.join(xParser.translateBuffer(aBody, xContext))
+        except Exception as xEx:
+            xContext.mError = '{}: file {}:{}'.format(xEx, xFqFileName, xContext.mLine)
+            xOutput = aBody
+            
+        if 'out' in aHeader:
+            xParser.writeOutput(aHeader['out'], xOutput)
+            xOutput = None
+        xParser.appendSymbols(xContext)
+        return {'error': xContext.mError, 'functions': xContext.mStats['functions'], 'source': True}, xOutput
+    
+# ------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------
+class TCorpus:
+    """ TCorpus generates reproducible C++ sources for benchmarks. The parameters are 
+    the total size and the size of a file in bytes, the nesting depth of statement 
+    blocks, the ratio of preprocessor lines, comment lines and statements with string 
+    literals, the ratio of class methods to free functions and the line width """
+    gDefaults = { 'size'    : 4 << 20, 
+                  'filesize': 64 << 10,
+                  'depth'   : 3,
+                  'macros'  : 0.05,
+                  'comments': 0.2,
+                  'strings' : 0.1,
+                  'methods' : 0.5,
+                  'width'   : 80,
+                  'seed'    : 1 }
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def __init__(self, aParams=None):
+        """ aParams overrides gDefaults. Values could be given as strings as from the 
+        command line, sizes with suffix K or M """
+        self.mParams = dict(self.gDefaults)
+        for xKey, xValue in (aParams or dict()).items():
+            if xKey not in self.gDefaults:
+                raise TranslateException('unknown corpus parameter: {}'.format(xKey))
+            self.mParams[xKey] = self.toValue(xValue, type(self.gDefaults[xKey]))
+        self.mRandom = random.Random(self.mParams['seed'])
+        
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    @staticmethod
+    def toValue(aValue, aType):
+        """ Convert a parameter to aType. Integers accept the suffix K and M """
+        if not isinstance(aValue, str):
+            return aType(aValue)
+        xScale = {'K': 1 << 10, 'M': 1 << 20}.get(aValue[-1:].upper(), 1)
+        if xScale > 1:
+            aValue = aValue[:-1]
+        return aType(float(aValue) * xScale) if aType is int else aType(aValue)
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def generate(self):
+        """ Return the list of generated file contents """
+        self.mRandom.seed(self.mParams['seed'])
+        xFileList = list()
+        xSize     = 0
+        while xSize < self.mParams['size']:
+            xFileList.append(self.generateFile(len(xFileList)))
+            xSize += len(xFileList[-1])
+        return xFileList
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def generateFile(self, aIndex):
+        """ Generate one file of about filesize bytes with classes and free functions """
+        xLines = ['#include "bench{}.h"'.format(aIndex)]
+        xSize  = 0
+        xCount = 0
+        while xSize < self.mParams['filesize']:
+            xCount += 1
+            if self.mRandom.random() < self.mParams['methods']:
+                xText = self.generateClass('C{}_{}'.format(aIndex, xCount))
+            else:
+                xText = self.generateFunction(str(), 'f{}'.format(xCount))
+            xLines.append(xText)
+            xSize += len(xText)
+        return '\n'.join(xLines) + '\n'
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def generateClass(self, aClass):
+        """ A class with inline methods and one method defined outside """
+        xLines = ['class {} {{'.format(aClass), 'public:']
+        for xIndex in range(self.mRandom.randint(1, 4)):
+            xLines.append(self.generateFunction(str(), 'm{}'.format(xIndex), 1))
+        xLines.append('};')
+        xLines.append(self.generateFunction(aClass + '::', 'mOut'))
+        return '\n'.join(xLines)
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def generateFunction(self, aScope, aName, aIndent=0):
+        """ A function definition with nested statement blocks """
+        xIndent = '    ' * aIndent
+        xLines  = ['{}int {}{}(int a, const char *s, double v[]) {{'.format(xIndent, aScope, aName)]
+        self.generateBlock(xLines, self.mParams['depth'], aIndent + 1)
+        xLines.append(xIndent + '    return a;')
+        xLines.append(xIndent + '}')
+        return '\n'.join(xLines)
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def generateBlock(self, aLines, aDepth, aIndent):
+        """ Append statements and nested blocks down to aDepth levels """
+        xIndent = '    ' * aIndent
+        for xStatement in range(self.mRandom.randint(2, 5)):
+            xRandom = self.mRandom.random()
+            if xRandom < self.mParams['comments']:
+                aLines.append(xIndent + self.padLine('// comment {} '.format(xStatement), len(xIndent)))
+            if self.mRandom.random() < self.mParams['macros']:
+                aLines.append('#ifdef SAPonNT')
+                aLines.append(xIndent + 'x = nt(a);')
+                aLines.append('#else')
+                aLines.append(xIndent + 'x = unix(a);')
+                aLines.append('#endif')
+            if aDepth > 0 and self.mRandom.random() < 0.4:
+                aLines.append(xIndent + 'if (a > {}) {{'.format(xStatement))
+                self.generateBlock(aLines, aDepth - 1, aIndent + 1)
+                aLines.append(xIndent + '}')
+            elif self.mRandom.random() < self.mParams['strings']:
+                aLines.append(xIndent + self.padLine('x = g(a, "text {{}} ; \\" {}"'.format(xStatement), len(xIndent)) + ');')
+            else:
+                aLines.append(xIndent + self.padLine('x = g(a, v[{}])'.format(xStatement), len(xIndent)) + ';')
+        
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def padLine(self, aText, aIndent):
+        """ Extend an expression or comment to the line width """
+        xText = aText
+        while len(xText) + aIndent + 8 < self.mParams['width']:
+            xText += ' + a * {}'.format(len(xText))
+        return xText
+    
+# ------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------
+class TBenchmark:
+    """ Performance checks for TParser.translate. The input is generated in memory and
+    translated to memory, so the timings are free of file system access. runCorpus 
+    reports the throughput as JSON, runLinear and runMemory check the scaling """
+    gLinearUnit = 'int f(int a, char *b) { NATIVE_BEGIN(a) x = a + b; y = x * 2; return g(x, y); } a = b + c; '
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def __init__(self, aReport=None):
+        """ aReport receives the result lines, default is stdout """
+        self.mReport = aReport or sys.stdout
+        
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def timeTranslate(self, aBuffer):
+        """ Translate aBuffer and return the elapsed time in seconds """
+        xParser  = TParser(str(), str())
+        xStart   = time.perf_counter()
+        xParser.translateText(aBuffer)
+        return time.perf_counter() - xStart
+        
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def runLinear(self, aSize=1 << 20, aMaxRatio=2.0):
+        """ Translate single-line inputs of a quarter, half and full aSize bytes. 
+        Returns 1, if the cost per byte grows by more than aMaxRatio from the 
+        smallest to the largest input """
+        xCostList = list()
+        
+        for xSize in [aSize // 4, aSize // 2, aSize]:
+            xBuffer  = self.gLinearUnit * (xSize // len(self.gLinearUnit))
+            xElapsed = min(self.timeTranslate(xBuffer) for xRun in range(3))
+            xCostList.append(xElapsed / len(xBuffer))
+            self.mReport.write('linear {:>9} bytes {:8.3f} s {:8.2f} MB/s\n'.format(
+                len(xBuffer), xElapsed, len(xBuffer) / xElapsed / (1 << 20)))
+        
+        xRatio = xCostList[-1] / xCostList[0]
+        self.mReport.write('linear cost ratio {:.2f} (max {:.2f})\n'.format(xRatio, aMaxRatio))
+        return 0 if xRatio <= aMaxRatio else 1
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def runMemory(self, aDepth=50000, aMaxBytes=256):
+        """ Translate a function with aDepth nested statement blocks and measure the 
+        peak memory with tracemalloc. Returns 1, if a nesting level costs more than 
+        aMaxBytes beyond the size of the input """
+        xBuffer = 'int f(int a) {\n' + 'if (a) { x = (a);\n' * aDepth + '}\n' * aDepth + '}\n'
+        xParser = TParser(str(), str())
+        
+        tracemalloc.start()
+        try:
+            xParser.translateText(xBuffer)
+            xCurrent, xPeak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        
+        xPerLevel = max(0, xPeak - len(xBuffer)) / aDepth
+        self.mReport.write('memory {:>9} bytes depth {} peak {:8.0f} KB {:8.1f} bytes/level (max {})\n'.format(
+            len(xBuffer), aDepth, xPeak / 1024, xPerLevel, aMaxBytes))
+        return 0 if xPerLevel <= aMaxBytes else 1
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def runCorpus(self, aCorpus, aRuns=3):
+        """ Translate the files of aCorpus in memory with TParser.translate. The time 
+        is the best of aRuns, the peak memory is measured in a separate run. Writes
+        the report as JSON and returns the report """
+        xFileList = aCorpus.generate()
+        xParser   = TParser(str(), str())
+        xElapsed  = None
+        
+        for xRun in range(aRuns):
+            xFunctions = 0
+            xStart     = time.perf_counter()
+            for xText in xFileList:
+                xContext = xParser.translate(io.StringIO(xText), io.StringIO())
+                xFunctions += xContext.mStats['functions']
+            xTime    = time.perf_counter() - xStart
+            xElapsed = xTime if xElapsed is None else min(xElapsed, xTime)
+            
+        tracemalloc.start()
+        try:
+            for xText in xFileList:
+                xParser.translate(io.StringIO(xText), io.StringIO())
+            xCurrent, xPeak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        
+        xBytes = sum(len(xText) for xText in xFileList)
+        xLines = sum(xText.count('\n') for xText in xFileList)
+        xReport = { 'version'     : __version__,
+                    'python'      : platform.python_version(),
+                    'corpus'      : aCorpus.mParams,
+                    'files'       : len(xFileList),
+                    'bytes'       : xBytes,
+                    'lines'       : xLines,
+                    'functions'   : xFunctions,
+                    'seconds'     : round(xElapsed, 4),
+                    'mb_per_s'    : round(xBytes / xElapsed / (1 << 20), 3),
+                    'lines_per_s' : round(xLines / xElapsed),
+                    'fct_per_s'   : round(xFunctions / xElapsed),
+                    'peak_kb'     : xPeak // 1024 }
+        self.mReport.write(json.dumps(xReport, indent=1, sort_keys=True) + '\n')
+        return xReport
+    
+# ------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------
+class TGolden:
+    """ Golden output checks for TParser.translate. A directory holds pairs of a source 
+    NAME and the expected output NAME.golden, which are translated with the configured 
+    parser, gDir is the corpus of the repository. The throughput of a TCorpus is compared 
+    with gMinRatio of a token scan in the same run and with the baseline in gBaseline """
+    gSuffix   = '.golden'
+    gBaseline = 'golden.json'
+    gDir      = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests', 'golden')
+    # Translation rate relative to the rate of gTokenPattern on the same machine, this
+    # is about 0.4, the former translation character by character reached 0.18
+    gMinRatio = 0.3
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def __init__(self, aParser=None, aReport=None):
+        """ aParser translates the directory sources, aReport receives the result lines, 
+        default is stdout """
+        self.mParser = aParser or TParser(str(), str())
+        self.mReport = aReport or sys.stdout
+        
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def compare(self, aName, aExpected, aOutput):
+        """ Report the difference of aOutput to aExpected. Returns 1 on mismatch """
+        if aOutput == aExpected:
+            self.mReport.write('golden {} ok\n'.format(aName))
+            return 0
+        self.mReport.write('golden {} failed\n'.format(aName))
+        self.mReport.writelines(difflib.unified_diff(
+            aExpected.splitlines(True), aOutput.splitlines(True), aName + self.gSuffix, aName))
+        return 1
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def sources(self, aDir):
+        """ Return the sorted paths of aDir, which have a golden file """
+        xPathList = list()
+        for xRoot, xDirs, xFiles in os.walk(aDir):
+            xDirs.sort()
+            for xFile in sorted(xFiles):
+                if not xFile.endswith(self.gSuffix) and xFile + self.gSuffix in xFiles:
+                    xPathList.append(os.path.join(xRoot, xFile))
+        return xPathList
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def translateFile(self, aDir, aFqFileName):
+        """ Translate a source of aDir in memory. Package and class are derived from the 
+        path relative to aDir, so the golden files do not depend on the location """
+        xContext = self.mParser.newContext(os.path.relpath(aFqFileName, aDir), self.mParser.mDefines, self.mParser.mValues)
+        return self.mParser.translateText(self.mParser.readSource(aFqFileName), xContext)
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def runDir(self, aDir, aRecord=False):
+        """ Compare the sources of aDir with their golden files. With aRecord the golden 
+        files are written for all sources of aDir and nothing is compared. Returns the 
+        number of mismatches """
+        xFailed = 0
+        if aRecord:
+            for xRoot, xDirs, xFiles in os.walk(aDir):
+                for xFile in xFiles:
+                    xFqFileName = os.path.join(xRoot, xFile)
+                    if os.path.splitext(xFile)[1] in self.mParser.mExtensions:
+                        with open(xFqFileName + self.gSuffix, 'w', encoding='utf-8', errors='surrogateescape', newline='') as xOut:
+                            xOut.write(self.translateFile(aDir, xFqFileName))
+                        self.mReport.write('golden {} recorded\n'.format(xFqFileName))
+            return xFailed
+        
+        xPathList = self.sources(aDir)
+        if not xPathList:
+            self.mReport.write('golden {} has no sources with {} files\n'.format(aDir, self.gSuffix))
+            return 1
+        for xFqFileName in xPathList:
+            with open(xFqFileName + self.gSuffix, 'r', encoding='utf-8', errors='surrogateescape', newline='') as xIn:
+                xFailed += self.compare(xFqFileName, xIn.read(), self.translateFile(aDir, xFqFileName))
+        return xFailed
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def measure(self, aTextList, aSize=1 << 20, aRuns=5):
+        """ Return the throughput in MB/s as the best of aRuns. aTextList is repeated 
+        up to aSize bytes, so short inputs give stable timings """
+        return self.timeRuns(aTextList, aSize, aRuns, 
+                             lambda aText: self.mParser.translate(io.StringIO(aText), io.StringIO()))
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def reference(self, aTextList, aSize=1 << 20, aRuns=5):
+        """ Return the rate in MB/s of a scan with gTokenPattern like measure. The ratio 
+        of both rates does not depend on the machine """
+        return self.timeRuns(aTextList, aSize, aRuns, 
+                             lambda aText: sum(1 for xMatch in gTokenPattern.finditer(aText)))
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    @staticmethod
+    def timeRuns(aTextList, aSize, aRuns, aFunction):
+        """ Return the rate in MB/s of aFunction for each text as the best of aRuns """
+        xBytes = sum(len(xText) for xText in aTextList) or 1
+        xTextList = aTextList * max(1, aSize // xBytes)
+        xBytes    = sum(len(xText) for xText in xTextList)
+        xElapsed  = None
+        for xRun in range(aRuns):
+            xStart = time.perf_counter()
+            for xText in xTextList:
+                aFunction(xText)
+            xTime    = time.perf_counter() - xStart
+            xElapsed = xTime if xElapsed is None else min(xElapsed, xTime)
+        return xBytes / xElapsed / (1 << 20)
+    
+    # --------------------------------------------------------------------------------
+    # --------------------------------------------------------------------------------            
+    def run(self, aDirs=None, aRecord=False, aRate=None, aTolerance=10.0):
+        """ Check the golden files of aDirs, default is gDir, then the throughput of a 
+        TCorpus of 1 MB. The gate is the larger of aRate, default is gMinRatio of the 
+        reference rate, and the baseline of the first directory reduced by aTolerance 
+        percent. With aRecord the golden files and the baseline are written. Returns 0 
+        on success and 1 otherwise """
+        aDirs   = aDirs or [self.gDir]
+        xFailed = 0
+        for xDir in aDirs:
+            xFailed += self.runDir(xDir, aRecord)
+        xTextList = TCorpus({'size': 1 << 20}).generate()
+        xRate     = self.measure(xTextList)
+        if aRate is None:
+            aRate = self.gMinRatio * self.reference(xTextList)
+        
+        xBaseline = os.path.join(aDirs[0], self.gBaseline)
+        if aRecord:
+            with open(xBaseline, 'w') as xOut:
+                json.dump({'version': __version__, 'python': platform.python_version(), 
+                           'mb_per_s': round(xRate, 3)}, xOut, indent=1, sort_keys=True)
+            self.mReport.write('golden {} recorded\n'.format(xBaseline))
+        
+        xGate = aRate
+        if not aRecord and os.path.isfile(xBaseline):
+            with open(xBaseline, 'r') as xIn:
+                xGate = max(xGate, json.load(xIn)['mb_per_s'] * (1.0 - aTolerance / 100.0))
+        
+        xSlow = xRate < xGate
+        self.mReport.write('throughput {:8.2f} MB/s (min {:.2f}) {}\n'.format(xRate, xGate, 'failed' if xSlow else 'ok'))
+        self.mReport.write('golden {} mismatches\n'.format(xFailed))
+        return 1 if xFailed or xSlow else 0
+    
+# --------------------------------------------------------------------------------
+# --------------------------------------------------------------------------------            
+def expandResponseFiles(aArgs, aDepth=0):
+    """ Replace each argument @FILE by the arguments in FILE. The file content is split
+    like a shell command line, lines starting with # are comments """
+    if aDepth > 8:
+        raise TranslateException('response files nested too deep')
+    
+    xArgs = list()
+    for xArg in aArgs:
+        if xArg.startswith('@') and len(xArg) > 1:
+            with open(xArg[1:], 'r') as xFile:
+                xArgs.extend(expandResponseFiles(shlex.split(xFile.read(), comments=True), aDepth + 1))
+        else:
+            xArgs.append(xArg)
+    return xArgs
     
 # --------------------------------------------------------------------------------
 # --------------------------------------------------------------------------------            
@@ -517,35 +2718,126 @@ def main(argv=None):
     program_build_date = "%s" % __updated__
 
     program_version_string = '%%prog %s (%s)' % (program_version, program_build_date)
-    #program_usage = '''usage: spam two eggs''' # optional - will be autogenerated by optparse
-    program_longdesc = '''''' # optional - give further explanation about what the program does
+    program_usage = '''usage: %prog [options] [@file] [- | serve SOCKET | client SOCKET [FILE [OUT]] | bench [check] [NAME=VALUE ...] | verify [record] [DIR ...] [rate=MB/S] [tolerance=PERCENT] | restore]'''
+    program_longdesc = '''bench writes a JSON report for a generated corpus, the NAME=VALUE arguments set the corpus parameters {}. bench check tests the scaling of time and memory. verify compares the NAME.golden files in DIR, default is tests/golden, with the translation and fails below the throughput rate [default: {} of a token scan] or the baseline {} in the first DIR, verify record writes the golden files and the baseline. restore replaces the translated files of the input by their .orig copy. client sends one file to the server like cppclient.py, which starts faster in a build'''.format(
+        ', '.join(sorted(TCorpus.gDefaults)), TGolden.gMinRatio, TGolden.gBaseline)
     program_license = "Copyright 2016 user_name (organization_name)                                            \
                 Licensed under the Apache License 2.0\nhttp://www.apache.org/licenses/LICENSE-2.0"
 
     if argv is None:
         argv = sys.argv[1:]
     try:
+        argv = expandResponseFiles(argv)
+        
         # setup option parser
-        parser = OptionParser(version=program_version_string, epilog=program_longdesc, description=program_license)
+        parser = OptionParser(version=program_version_string, epilog=program_longdesc, description=program_license, usage=program_usage)
         parser.add_option("-i", "--in",       dest="infile",  help="set input path [default: %default]")
         parser.add_option("-s", "--sherlok",  dest="sherlok", help="set sherlok development path [default: %default]")
+        parser.add_option("--include",        dest="include", action="append", help="translate only files matching the glob pattern, could be repeated")
+        parser.add_option("--exclude",        dest="exclude", action="append", help="skip files and directories matching the glob pattern, could be repeated")
+        parser.add_option("--ext",            dest="ext",     help="set comma separated source file extensions [default: %default]")
+        parser.add_option("--incremental",    dest="incremental", action="store_true", help="skip files unchanged since the last run, see " + TManifest.gFileName)
+        parser.add_option("-D", "--define",   dest="define",  action="append", help="define NAME[=VALUE] for conditional blocks, could be repeated")
+        parser.add_option("-U", "--undefine", dest="undefine", action="append", help="remove a predefined NAME, could be repeated")
+        parser.add_option("-I", "--include-path", dest="incpath", action="append", help="apply the defines of headers found in DIR to conditional blocks, could be repeated")
+        parser.add_option("--limit",          dest="limit",   action="append", help="set NAME=VALUE of the limits " + ', '.join(sorted(TParser.gLimits)) + ", files exceeding a limit are passed unchanged, could be repeated")
+        parser.add_option("--strip",          dest="strip",   action="append", help="remove calls of the macro NAME from the source, could be repeated")
+        parser.add_option("-o", "--out",      dest="out",     help="write the translated files to the directory OUT, the input is not changed")
+        parser.add_option("--target",         dest="target",  action="append", help="write to DIR with additional defines, DIR[:NAME[=VALUE],...], could be repeated")
+        parser.add_option("--rules",          dest="rules",   help="read the rules for selective instrumentation from RULES, see TRules")
+        parser.add_option("--ids",            dest="ids",     action="store_true", help="inject CCQ_SHERLOK_FCT_BEGIN_ID with a function ID and write the table " + TParser.gSymbolFile)
+        parser.add_option("--index",          dest="index",   help="write the function index to INDEX, SQLite for the extensions " + ', '.join(TIndex.gSqlite) + ", else JSON lines")
+        parser.add_option("--stats",          dest="stats",   type="choice", choices=["text", "json"], help="report counters, timers and the slowest files as text or json")
+        parser.add_option("--stats-file",     dest="statsfile", help="write the stats report to STATSFILE instead of stdout")
+        parser.add_option("--filter",         dest="filter",  action="store_true", help="translate stdin to stdout, same as the argument -")
+        parser.add_option("--package",        dest="package", help="set the package of the filter and client mode, default is empty or derived from FILE")
+        parser.add_option("--class",          dest="klass",   help="set the class of free functions in the filter and client mode, default is empty or derived from FILE")
+        parser.add_option("-j", "--jobs",     dest="jobs",    type="int", help="set number of processes, 0 is one per CPU [default: %default]")
         parser.add_option("-v", "--verbose",  dest="verbose", action="count", help="set verbosity level [default: %default]")
 
         # set defaults
-        parser.set_defaults(infile=".", sherlok=".")
+        parser.set_defaults(infile=".", sherlok=".", jobs=1, ext=",".join(TParser.gExtensions), incremental=False)
 
         # process options
         (opts, args) = parser.parse_args(argv)
 
+        if args and args[0] == 'bench':
+            xBenchmark = TBenchmark()
+            if args[1:2] == ['check']:
+                return max(xBenchmark.runLinear(), xBenchmark.runMemory())
+            if not all('=' in xArg for xArg in args[1:]):
+                raise TranslateException('bench arguments are NAME=VALUE')
+            xBenchmark.runCorpus(TCorpus(dict(xArg.split('=', 1) for xArg in args[1:])))
+            return 0
+
+        # Thin client: The parser is not needed, see cppclient.py
+        if args[:1] == ['client']:
+            import cppclient
+            xArgs = args[1:]
+            if opts.package is not None:
+                xArgs = ['--package', opts.package] + xArgs
+            if opts.klass is not None:
+                xArgs = ['--class', opts.klass] + xArgs
+            return cppclient.main(xArgs)
+        
+        # MAIN BODY #
+        aParser = TParser(opts.infile, opts.sherlok, opts.jobs, opts.include, opts.exclude, opts.ext.split(','), opts.incremental);
+        aParser.setDefines(opts.define, opts.undefine)
+        aParser.setStats(opts.stats, opts.statsfile)
+        aParser.setRules(opts.rules)
+        aParser.setLimits(opts.limit)
+        aParser.mIds = bool(opts.ids)
+        aParser.mIndexFile = opts.index
+        aParser.mIncludePath = list(opts.incpath or [])
+        aParser.mUndefines.update(opts.strip or [])
+        
+        if opts.out:
+            aParser.addTarget(opts.out)
+        for xTarget in opts.target or []:
+            xOutDir, xSep, xDefines = xTarget.rpartition(':')
+            # A drive letter is part of the directory
+            if not xSep or len(xOutDir) < 2 or '/' in xDefines or '\\' in xDefines:
+                xOutDir, xDefines = xTarget, str()
+            aParser.addTarget(xOutDir, [xDefine for xDefine in xDefines.split(',') if xDefine])
+        
+        if args[:1] == ['restore']:
+            aParser.restoreProject()
+            return 0
+        
+        if args[:1] == ['serve']:
+            if len(args) < 2:
+                raise TranslateException('serve needs the path of the socket')
+            TServer(aParser, args[1]).serve()
+            return 0
+        
+        if args[:1] == ['verify']:
+            xRecord = args[1:2] == ['record']
+            xParams = {'rate': None, 'tolerance': 10.0}
+            xDirs   = list()
+            for xArg in args[2 if xRecord else 1:]:
+                xName, xSep, xValue = xArg.partition('=')
+                if xSep and xName in xParams:
+                    xParams[xName] = float(xValue)
+                else:
+                    xDirs.append(xArg)
+            return TGolden(aParser).run(xDirs, xRecord, xParams['rate'], xParams['tolerance'])
+        
+        # Filter mode: stdout is reserved for the translated source
+        if opts.filter or args[:1] == ['-']:
+            xContext = TContext('-', aParser.mDefines, aParser.mValues)
+            xContext.mPackage = opts.package or str()
+            xContext.mClass   = opts.klass or str()
+            aParser.translateFilter(sys.stdin, sys.stdout, xContext)
+            if xContext.mError:
+                sys.stderr.write('{}: {}, passed unchanged\n'.format(program_name, xContext.mError))
+            return 0
+        
         #if opts.verbose > 0:
         #    print("verbosity level = %d" % opts.verbose)
         if opts.infile:
             print("infile  = {}".format(opts.infile))
         if opts.sherlok:
             print("sherlok = {}".format(opts.sherlok))
-
-        # MAIN BODY #
-        aParser = TParser(opts.infile, opts.sherlok);
         aParser.translateProject()
         
     except Exception as e:
@@ -0,0 +1,4 @@
+// } a closing bracket {
+/* { */ int find(char c) { return c == '}' ? 1 : 0; } /* } */
+const char *gText = "\"{\\";
+int quote() { return '\'' + '{'; }
@@ -0,0 +1,7 @@
+#if '\xZZ'
+int a() { }
+#endif
+#if 1 << -1
+int b() { }
+#endif
+int c() { }
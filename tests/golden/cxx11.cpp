@@ -0,0 +1,10 @@
+namespace app::io {
+struct TReader {
+    TReader(int aSize) : mBuffer{aSize}, mPos(0) { }
+    bool operator()(const std::string &aLine) const { return aLine.empty(); }
+    std::function<void()> mDone = [this]() { mPos = 0; };
+};
+template<class T> T TCache<T>::get(std::map<int, T> &aMap, T) { return aMap[0]; }
+}
+static auto gText = R"({ "a": "}" })";
+long gSize = 1'000'000;
@@ -0,0 +1,7 @@
+class TList {
+public:
+    int size(int aFrom) const { return mSize - aFrom; }
+    void clear();
+};
+void TList::clear() { NATIVE_BEGIN(0) mSize = 0; }
+static char *copy(const char *aSrc, int aLen[]) { return strdup(aSrc); }
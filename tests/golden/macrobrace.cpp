@@ -0,0 +1,8 @@
+void f() {
+#ifdef SAPonNT
+ x();
+}
+#else
+ y();
+}
+#endif
@@ -0,0 +1,3 @@
+int mainU(int argc, char **argv) {
+    return run(argc, argv);
+}
@@ -0,0 +1,14 @@
+#if defined(SAPonNT) && !defined(UNIX)
+int open(int aMode) {
+#else
+int open(int aMode, int aFlags) {
+#endif
+    return aMode;
+}
+#ifdef UNDEFINED
+# if VERSION > 1
+void skipped() { {
+# endif
+#elif 1
+void taken(int a) { }
+#endif
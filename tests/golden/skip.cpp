@@ -0,0 +1,3 @@
+/*CCQ_SHERLOK_SKIP_FCTN*/
+int hidden(int a) { return a; }
+int visible(int a) { return a; }
@@ -0,0 +1,2 @@
+/*CCQ_SHERLOK_SKIP_FILE*/
+int hidden(int a) { return a; }
@@ -0,0 +1,10 @@
+std::function<void(int)> a2(int y) { return nullptr; }
+template<> void f<int>(int x) { g(x); }
+template<class T> void TList<T>::put<int>(T x) { g(x); }
+X::X() try : Y() { } catch (...) { }
+int h() try { return 1; } catch (const std::exception &e) { return 0; }
+std::map<int, std::pair<int, int>> pairs(int n, std::string const &s) { return {}; }
+bool operator<(const X &a, const X &b) { return a.v < b.v; }
+#if VERSION < 2
+#endif
+void after(int x) { }
@@ -0,0 +1,2 @@
+int f(int a) { return a; }
+/* open comment { int g() { }
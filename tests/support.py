@@ -0,0 +1,47 @@
+# ------------------------------------------------------------------------------------
+# Small project trees for the command line tests of cppparser.py
+# ------------------------------------------------------------------------------------
+import os
+
+import cppparser
+
+gScript = os.path.abspath(cppparser.__file__)
+gSource = '''int one(int a)
+{
+    x = a;
+}
+int two(int a)
+{
+    x = a;
+    return x;
+}
+#ifdef FEATURE
+void on() { }
+#endif
+'''
+
+
+# ------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------
+def makeTree(aRoot, aFiles):
+    """ Write aFiles, a dict of relative path and text, below aRoot """
+    for xPath, xText in aFiles.items():
+        xFqFileName = os.path.join(str(aRoot), xPath)
+        os.makedirs(os.path.dirname(xFqFileName), exist_ok=True)
+        with open(xFqFileName, 'w', newline='') as xOut:
+            xOut.write(xText)
+    return str(aRoot)
+
+
+# ------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------
+def readFile(aRoot, aPath):
+    with open(os.path.join(str(aRoot), aPath), 'r', newline='') as xIn:
+        return xIn.read()
+
+
+# ------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------
+def run(aRoot, *aArgs):
+    """ Translate aRoot in place without the cti files """
+    return cppparser.main(['-i', str(aRoot), '-s', os.path.join(str(aRoot), 'none')] + list(aArgs))
@@ -0,0 +1,18 @@
+# ------------------------------------------------------------------------------------
+# Filter mode from stdin to stdout
+# ------------------------------------------------------------------------------------
+import io
+import sys
+
+import cppparser
+from support import gSource
+
+
+# ------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------
+def test_filter(monkeypatch, capsys):
+    monkeypatch.setattr(sys, 'stdin', io.StringIO(gSource))
+    assert cppparser.main(['--package', 'app', '--class', 'TApp', '-']) == 0
+    xOutput = capsys.readouterr().out
+    assert xOutput.startswith('#include "cti.h"')
+    assert 'cR("app"), cR("TApp"), cR("one")' in xOutput
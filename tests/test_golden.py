@@ -0,0 +1,38 @@
+# ------------------------------------------------------------------------------------
+# Golden output of the corpus in tests/golden, see TGolden
+# ------------------------------------------------------------------------------------
+import doctest
+import io
+import os
+
+import pytest
+
+import cppparser
+from cppparser import TCorpus, TGolden, TParser
+
+
+# ------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------
+@pytest.mark.parametrize('aFqFileName', TGolden().sources(TGolden.gDir), ids=os.path.basename)
+def test_golden(aFqFileName):
+    xReport = io.StringIO()
+    xGolden = TGolden(TParser(str(), str()), xReport)
+    with open(aFqFileName + TGolden.gSuffix, 'r', encoding='utf-8', errors='surrogateescape', newline='') as xIn:
+        xExpected = xIn.read()
+    assert xGolden.compare(aFqFileName, xExpected, xGolden.translateFile(TGolden.gDir, aFqFileName)) == 0, xReport.getvalue()
+
+
+# ------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------
+def test_throughput():
+    xGolden   = TGolden(TParser(str(), str()))
+    xTextList = TCorpus({'size': 1 << 20}).generate()
+    xRate     = xGolden.measure(xTextList, aRuns=3)
+    xScan     = xGolden.reference(xTextList, aRuns=3)
+    assert xRate >= TGolden.gMinRatio * xScan, '{:.2f} MB/s, token scan {:.2f} MB/s'.format(xRate, xScan)
+
+
+# ------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------
+def test_doctest():
+    assert doctest.testmod(cppparser).failed == 0
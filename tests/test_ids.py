@@ -0,0 +1,16 @@
+# ------------------------------------------------------------------------------------
+# Numeric function ids and the symbol file
+# ------------------------------------------------------------------------------------
+from cppparser import TParser
+from support import gSource, makeTree, readFile, run
+
+
+# ------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------
+def test_ids(tmp_path):
+    xRoot = makeTree(tmp_path, {'a.cpp': gSource})
+    run(xRoot, '--ids')
+    assert 'CCQ_SHERLOK_FCT_BEGIN_ID(' in readFile(xRoot, 'a.cpp')
+    xRows = readFile(xRoot, TParser.gSymbolFile).splitlines()
+    assert xRows[0].startswith('# id')
+    assert sorted(xRow.split('\t')[3] for xRow in xRows[1:]) == ['one', 'two']
@@ -0,0 +1,32 @@
+# ------------------------------------------------------------------------------------
+# Include path and header cache with the manifest
+# ------------------------------------------------------------------------------------
+from cppparser import TParser
+from support import gSource, makeTree, readFile, run
+
+
+# ------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------
+def test_include_path(tmp_path, capsys):
+    xRoot = makeTree(tmp_path / 'src', {'a.cpp': '#include "cfg.h"\n' + gSource})
+    xInc  = makeTree(tmp_path / 'inc', {'cfg.h': '#ifndef CFG_H\n#define CFG_H\n#define FEATURE\n#endif\n'})
+    run(xRoot, '-I', xInc, '--incremental')
+    assert 'cR("on")' in readFile(xRoot, 'a.cpp')
+    
+    # The manifest keeps the stats of the header
+    makeTree(tmp_path / 'inc', {'cfg.h': '#ifndef CFG_H\n#define CFG_H\n#endif\n'})
+    capsys.readouterr()
+    run(xRoot, '-I', xInc, '--incremental')
+    assert 'translated 1 files, 0 unchanged' in capsys.readouterr().out
+    assert 'cR("on")' not in readFile(xRoot, 'a.cpp')
+    
+    # A header translated in place is read from its original
+    makeTree(tmp_path / 'inc', {'cfg.h.orig': '#define FEATURE\n', 'cfg.h': '#include "cti.h"\n'})
+    xParser = TParser(xRoot, str())
+    xParser.mIncludePath = [xInc]
+    assert 'cR("on")' in xParser.translateText('#include <cfg.h>\n' + gSource)
+    
+    # A missing header is looked up again
+    assert 'cR("on")' not in xParser.translateText('#include <new.h>\n' + gSource)
+    makeTree(tmp_path / 'inc', {'new.h': '#define FEATURE\n'})
+    assert 'cR("on")' in xParser.translateText('#include <new.h>\n' + gSource)
@@ -0,0 +1,23 @@
+# ------------------------------------------------------------------------------------
+# Incremental translation with the manifest, see TManifest
+# ------------------------------------------------------------------------------------
+import os
+
+from cppparser import TManifest
+from support import gSource, makeTree, readFile, run
+
+
+# ------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------
+def test_incremental(tmp_path, capsys):
+    xRoot = makeTree(tmp_path, {'a.cpp': gSource, 'b.cpp': gSource})
+    run(xRoot, '--incremental')
+    assert os.path.isfile(os.path.join(xRoot, TManifest.gFileName))
+    capsys.readouterr()
+    run(xRoot, '--incremental')
+    assert 'translated 2 files, 2 unchanged' in capsys.readouterr().out
+    
+    makeTree(tmp_path, {'b.cpp.orig': gSource.replace('two', 'three')})
+    run(xRoot, '--incremental')
+    assert 'translated 2 files, 1 unchanged' in capsys.readouterr().out
+    assert 'cR("three")' in readFile(xRoot, 'b.cpp')
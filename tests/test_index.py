@@ -0,0 +1,25 @@
+# ------------------------------------------------------------------------------------
+# Function index in JSON lines or SQLite, see TIndex
+# ------------------------------------------------------------------------------------
+import json
+import sqlite3
+
+import pytest
+
+from support import gSource, makeTree, run
+
+
+# ------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------
+@pytest.mark.parametrize('aIndex', ['index.jsonl', 'index.db'])
+def test_index(tmp_path, aIndex):
+    xRoot  = makeTree(tmp_path / 'src', {'a.cpp': gSource})
+    xIndex = str(tmp_path / aIndex)
+    run(xRoot, '--index', xIndex)
+    if aIndex.endswith('.db'):
+        with sqlite3.connect(xIndex) as xDb:
+            xRecords = [dict(zip(('method', 'line'), xRow)) for xRow in xDb.execute('select method, line from functions order by line')]
+    else:
+        with open(xIndex) as xIn:
+            xRecords = [json.loads(xLine) for xLine in xIn]
+    assert [(xRecord['method'], xRecord['line']) for xRecord in xRecords] == [('one', 2), ('two', 6)]
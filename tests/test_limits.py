@@ -0,0 +1,21 @@
+# ------------------------------------------------------------------------------------
+# Limits for pathological inputs, see TLimitException
+# ------------------------------------------------------------------------------------
+import os
+
+from support import gSource, makeTree, readFile, run
+
+
+# ------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------
+def test_limits(tmp_path, capsys):
+    xDeep = 'void deep() ' + '{' * 5000 + '}' * 5000 + '\n'
+    xOpen = 'int f(int a) { return a; }\n}\nvoid n(int x) {}\n'
+    xRoot = makeTree(tmp_path, {'a.cpp': gSource, 'deep.cpp': xDeep, 'open.cpp': xOpen})
+    run(xRoot, '--limit', 'depth=1K')
+    assert readFile(xRoot, 'deep.cpp') == xDeep
+    assert readFile(xRoot, 'open.cpp') == xOpen
+    assert readFile(xRoot, 'a.cpp').startswith('#include "cti.h"')
+    xOutput = capsys.readouterr().out
+    assert '2 passed, 0 errors' in xOutput
+    assert 'unbalanced closing bracket: file {}:2'.format(os.path.join(xRoot, 'open.cpp')) in xOutput
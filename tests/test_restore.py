@@ -0,0 +1,39 @@
+# ------------------------------------------------------------------------------------
+# Restore of a translated tree from the .orig copies
+# ------------------------------------------------------------------------------------
+import os
+
+import pytest
+
+import cppparser
+from cppparser import TManifest, TParser, TranslateException
+from support import gSource, makeTree, readFile, run
+
+
+# ------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------
+def test_restore(tmp_path):
+    xRoot = makeTree(tmp_path, {'a.cpp': gSource, 'sub/b.cpp': gSource, 'cti.h': '', 'cti.cpp': ''})
+    run(xRoot, '--ids', '--incremental')
+    assert readFile(xRoot, 'sub/b.cpp').startswith('#include "cti.h"')
+    assert cppparser.main(['-i', xRoot, 'restore']) == 0
+    assert readFile(xRoot, 'a.cpp') == gSource
+    assert readFile(xRoot, 'sub/b.cpp') == gSource
+    assert not os.path.exists(os.path.join(xRoot, 'a.cpp.orig'))
+    for xFile in TParser.gSkipFiles + [TManifest.gFileName, TParser.gSymbolFile]:
+        assert not os.path.exists(os.path.join(xRoot, xFile))
+
+
+# ------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------
+def test_restore_changed(tmp_path):
+    xRoot = makeTree(tmp_path, {'a.cpp': gSource, 'b.cpp': gSource, 'cti.h': '', 'cti.cpp': ''})
+    run(xRoot, '--ids', '--incremental')
+    makeTree(tmp_path, {'b.cpp': 'int edited();\n'})
+    with pytest.raises(TranslateException, match='1 of 2 files not restored'):
+        cppparser.main(['-i', xRoot, 'restore'])
+    assert readFile(xRoot, 'a.cpp') == gSource
+    assert readFile(xRoot, 'b.cpp') == 'int edited();\n'
+    # The kept file still includes cti.h
+    for xFile in TParser.gSkipFiles + [TManifest.gFileName, TParser.gSymbolFile, 'b.cpp.orig']:
+        assert os.path.exists(os.path.join(xRoot, xFile))
@@ -0,0 +1,19 @@
+# ------------------------------------------------------------------------------------
+# Selective instrumentation with a rule file, see TRules
+# ------------------------------------------------------------------------------------
+import os
+
+from support import gSource, makeTree, readFile, run
+
+
+# ------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------
+def test_rules(tmp_path):
+    xRoot = makeTree(tmp_path / 'src', {'a.cpp': gSource + 'int get() { return 1; }\n'})
+    xRules = makeTree(tmp_path, {'rules.txt': '# small functions\nmaxbody 1\ntrivial\nexclude method=^on$\n'})
+    run(xRoot, '--rules', os.path.join(xRules, 'rules.txt'), '-D', 'FEATURE')
+    xOutput = readFile(xRoot, 'a.cpp')
+    assert 'cR("one")' not in xOutput
+    assert 'cR("two")' in xOutput
+    assert 'cR("get")' not in xOutput
+    assert 'cR("on")' not in xOutput
@@ -0,0 +1,39 @@
+# ------------------------------------------------------------------------------------
+# Server mode and the thin client cppclient.py, see TServer
+# ------------------------------------------------------------------------------------
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+from support import gScript, gSource, makeTree, readFile
+
+
+# ------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------
+@pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'), reason='server needs unix sockets')
+def test_server(tmp_path):
+    xRoot   = makeTree(tmp_path, {'a.cpp': gSource})
+    xSocket = str(tmp_path / 'sherlok.sock')
+    xServer = subprocess.Popen([sys.executable, gScript, 'serve', xSocket], stdout=subprocess.DEVNULL)
+    try:
+        xTimeout = time.monotonic() + 10.0
+        while not os.path.exists(xSocket) and time.monotonic() < xTimeout:
+            time.sleep(0.05)
+        
+        xOut = os.path.join(xRoot, 'out.cpp')
+        xResult = subprocess.run([sys.executable, gScript, 'client', xSocket, os.path.join(xRoot, 'a.cpp'), xOut])
+        assert xResult.returncode == 0
+        assert 'cR("one")' in readFile(xRoot, 'out.cpp')
+        
+        xClient = os.path.join(os.path.dirname(gScript), 'cppclient.py')
+        xResult = subprocess.run([sys.executable, xClient, xSocket, os.path.join(xRoot, 'missing.cpp')], 
+                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        assert xResult.returncode == 1
+        assert 'no output' in xResult.stderr
+    finally:
+        xServer.terminate()
+        xServer.wait()
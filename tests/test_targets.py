@@ -0,0 +1,16 @@
+# ------------------------------------------------------------------------------------
+# Translation into several target trees, see TParser.translateTargets
+# ------------------------------------------------------------------------------------
+from support import gSource, makeTree, readFile, run
+
+
+# ------------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------------
+def test_targets(tmp_path):
+    xRoot = makeTree(tmp_path / 'src', {'a.cpp': gSource})
+    xOff  = str(tmp_path / 'off')
+    xOn   = str(tmp_path / 'on')
+    run(xRoot, '--target', xOff, '--target', xOn + ':FEATURE')
+    assert readFile(xRoot, 'a.cpp') == gSource
+    assert 'cR("on")' not in readFile(xOff, 'a.cpp')
+    assert 'cR("on")' in readFile(xOn, 'a.cpp')